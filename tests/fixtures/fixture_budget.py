@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.fixture
+def query_budget(db):
+    """
+    Контекстный менеджер, проверяющий бюджет SQL-запросов и времени:
+
+        with query_budget(5, 0.5, label='index'):
+            client.get('/')
+    """
+    from core.budget import query_budget as _query_budget
+    return _query_budget
+
+
+@pytest.fixture
+def seeded_data(db):
+    """Правдоподобный объем пользователей, групп, постов и подписок."""
+    from posts.tests.setting import QueryBudgetMixin
+    return QueryBudgetMixin.seed_data()
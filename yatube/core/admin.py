@@ -0,0 +1,46 @@
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import RequestProfile
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created', 'view_name', 'path', 'status', 'duration',
+                    'samples', 'user', 'download_link')
+    list_filter = ('view_name', 'status')
+    search_fields = ('path', 'view_name')
+    readonly_fields = ('created', 'user', 'method', 'path', 'view_name',
+                       'status', 'duration', 'samples', 'download_link')
+    exclude = ('file',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:profile_id>/download/',
+                 self.admin_site.admin_view(self.download),
+                 name='core_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download(self, request, profile_id):
+        """Отдает файл профиля: он лежит вне MEDIA_ROOT."""
+        profile = get_object_or_404(RequestProfile, pk=profile_id)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        return FileResponse(profile.file.open('rb'), as_attachment=True,
+                            filename=profile.file.name.rsplit('/', 1)[-1])
+
+    def download_link(self, profile):
+        return format_html(
+            '<a href="{}">скачать</a>',
+            reverse('admin:core_requestprofile_download',
+                    args=(profile.pk,)))
+    download_link.short_description = 'Файл'
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,40 @@
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class BudgetExceeded(AssertionError):
+    """Блок кода выполнил больше запросов или работал дольше бюджета"""
+
+
+def format_queries(queries):
+    return '\n'.join(f'{number}. {query["sql"]} ({query["time"]} с)'
+                     for number, query in enumerate(queries, start=1))
+
+
+@contextmanager
+def query_budget(max_queries, max_seconds=None, label='',
+                 using=DEFAULT_DB_ALIAS):
+    """
+    Проверяет, что блок укладывается в max_queries SQL-запросов
+    и max_seconds секунд. При превышении бросает BudgetExceeded
+    со списком выполненных запросов.
+    """
+    context = CaptureQueriesContext(connections[using])
+    started = time.perf_counter()
+    with context:
+        yield context
+    elapsed = time.perf_counter() - started
+    problems = []
+    if len(context) > max_queries:
+        problems.append(
+            f'{len(context)} SQL-запросов при бюджете {max_queries}')
+    if max_seconds is not None and elapsed > max_seconds:
+        problems.append(
+            f'{elapsed:.3f} с при бюджете {max_seconds} с')
+    if problems:
+        raise BudgetExceeded(
+            f'{label}: ' + ', '.join(problems) + '\n'
+            + format_queries(context.captured_queries))
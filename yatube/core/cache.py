@@ -0,0 +1,198 @@
+"""
+Кэширование страниц с версионированными ключами.
+
+Каждая страница зависит от одной или нескольких областей (scope),
+например 'index', 'group:<slug>' или 'profile:<username>'.
+Версии областей хранятся в кэше и входят в ключ страницы, поэтому
+bump() мгновенно делает устаревшими все закэшированные страницы
+области, включая все варианты ?page=, без их перебора.
+
+Чтобы истекшая или устаревшая страница не пересчитывалась всеми
+воркерами одновременно, пересчет выполняет только захвативший
+блокировку запрос, а остальные получают предыдущую копию.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import timing
+
+
+def version_key(scope):
+    return f'cache_version:{scope}'
+
+
+def get_versions(scopes):
+    """
+    Возвращает текущие версии областей.
+    Отсутствующая версия заводится по текущему времени, а не с нуля,
+    чтобы вытесненный из кэша счетчик не вернулся к старому значению.
+    """
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    """Делает устаревшими все страницы, зависящие от scopes."""
+    for scope in scopes:
+        key = version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def versions_etag(request, scopes, *extra):
+    """
+    ETag страницы по версиям областей: меняется при каждом bump()
+    и не требует запросов к базе.
+    """
+    parts = [request.get_full_path(), *get_versions(scopes), *extra]
+    return hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def user_key(request):
+    return request.user.pk if request.user.is_authenticated else 'anon'
+
+
+def format_scopes(request, scopes, kwargs):
+    """
+    Подставляет в области аргументы view и {user} - id пользователя
+    или 'anon': 'group:{slug}', 'follows:{user}'.
+    """
+    return [scope.format(user=user_key(request), **kwargs)
+            for scope in scopes]
+
+
+def scoped_etag(*scopes):
+    """
+    etag_func для condition(): ETag страницы, зависящей от областей
+    scopes и от пользователя. Области форматируются как в cache_feed.
+    """
+    def etag(request, *args, **kwargs):
+        return versions_etag(request, format_scopes(request, scopes, kwargs),
+                             user_key(request))
+    return etag
+
+
+def page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'page:{path}:{user_key(request)}'
+
+
+def record(name, event):
+    """Увеличивает счетчик событий кэша: hit, stale или miss."""
+    timing.count_cache('page', event)
+    key = f'cache_metrics:{name}:{event}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_metrics(name):
+    events = ('hit', 'stale', 'miss')
+    values = cache.get_many([f'cache_metrics:{name}:{event}'
+                             for event in events])
+    return {event: values.get(f'cache_metrics:{name}:{event}', 0)
+            for event in events}
+
+
+def wait_for_entry(key, seconds):
+    """Ждет, пока держатель блокировки положит страницу в кэш."""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def fresh_response(name, entry, versions):
+    """Копия из кэша, если версии областей не менялись и срок не вышел."""
+    if entry is None:
+        return None
+    entry_versions, fresh_until, response = entry
+    if entry_versions != versions or time.time() >= fresh_until:
+        return None
+    record(name, 'hit')
+    return response
+
+
+def stale_response(name, key, entry):
+    """
+    Копия для запроса, которому не досталась блокировка пересчета:
+    устаревшая, а без нее - та, что держатель блокировки успеет
+    положить за FEED_CACHE_WAIT секунд.
+    """
+    if entry is None:
+        entry = wait_for_entry(key, settings.FEED_CACHE_WAIT)
+    if entry is None:
+        return None
+    record(name, 'stale')
+    return entry[2]
+
+
+def render_and_store(view, request, args, kwargs, key, versions, timeout):
+    """Пересчитывает страницу под блокировкой и кладет ее в кэш."""
+    record(view.__name__, 'miss')
+    lock_key = f'lock:{key}'
+    try:
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.cookies:
+            ttl = timeout or settings.FEED_CACHE_TIMEOUT
+            cache.set(key, (versions, time.time() + ttl, response),
+                      ttl + settings.FEED_CACHE_GRACE)
+    finally:
+        cache.delete(lock_key)
+    return response
+
+
+def cache_feed(*scopes, timeout=None):
+    """
+    Кэширует страницу, пока не изменится версия одной из областей.
+    Области могут ссылаться на аргументы view и на пользователя:
+    'group:{slug}', 'follows:{user}'.
+    Ключ учитывает полный путь с параметрами и пользователя.
+
+    Устаревшую копию пересчитывает один запрос, захвативший блокировку,
+    остальные в это время получают старую копию (не дольше
+    FEED_CACHE_GRACE секунд после истечения срока или пока жива
+    блокировка после смены версии). Если копии нет совсем, запрос
+    без блокировки ждет ее не дольше FEED_CACHE_WAIT секунд, а потом
+    считает страницу сам, не сохраняя, чтобы не занимать воркер.
+    """
+    def decorator(view):
+        name = view.__name__
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = page_key(request)
+            versions = get_versions(format_scopes(request, scopes, kwargs))
+            entry = cache.get(key)
+            response = fresh_response(name, entry, versions)
+            if response is not None:
+                return response
+            if cache.add(f'lock:{key}', 1, settings.FEED_CACHE_LOCK_TIMEOUT):
+                return render_and_store(view, request, args, kwargs, key,
+                                        versions, timeout)
+            response = stale_response(name, key, entry)
+            if response is not None:
+                return response
+            record(name, 'miss')
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
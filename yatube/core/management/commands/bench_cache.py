@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'mmap': 'core.mmap_cache.MmapCache',
+}
+
+
+def make_cache(name, directory):
+    params = {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 100000}}
+    location = os.path.join(directory, name)
+    if name == 'locmem':
+        location = 'bench'
+    elif name == 'mmap':
+        params['OPTIONS'] = {'SLOTS': 16384, 'SLOT_SIZE': 4096}
+    return import_string(BACKENDS[name])(location, params)
+
+
+def run_worker(name, directory, options, seed, results):
+    """
+    Имитирует воркер: читает страницы по популярным ключам и при
+    промахе «рендерит» и кладет их в кэш.
+    """
+    cache = make_cache(name, directory)
+    rnd = random.Random(seed)
+    value = 'x' * options['size']
+    hits = 0
+    started = time.perf_counter()
+    for _ in range(options['requests']):
+        key = f'page:{int(rnd.paretovariate(1.2)) % options["keys"]}'
+        if cache.get(key) is None:
+            cache.set(key, value)
+        else:
+            hits += 1
+    results.put((hits, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает кэш в mmap-файле с LocMemCache и файловым кэшем: '
+            'скорость операций и долю попаданий при нескольких воркерах')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=5000)
+        parser.add_argument('--size', type=int, default=2048,
+                            help='Размер значения в байтах')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=5000,
+                            help='Запросов на воркер')
+        parser.add_argument('--keys', type=int, default=500)
+        parser.add_argument('--backends', nargs='+', choices=BACKENDS,
+                            default=list(BACKENDS))
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='bench_cache_')
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                'Один процесс, тыс. операций в секунду'))
+            self.stdout.write(f'{"":<10} {"set":>10} {"get":>10} '
+                              f'{"incr":>10}')
+            for name in options['backends']:
+                rates = self.measure(make_cache(name, directory), options)
+                self.stdout.write(f'{name:<10} ' + ' '.join(
+                    f'{rate / 1000:>10.1f}' for rate in rates))
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'Воркеров: {options["workers"]}, общий поток запросов'))
+            self.stdout.write(f'{"":<10} {"попадания":>10} '
+                              f'{"тыс. rps":>10}')
+            for name in options['backends']:
+                make_cache(name, directory).clear()
+                hit_rate, rate = self.measure_workers(
+                    name, directory, options)
+                self.stdout.write(
+                    f'{name:<10} {hit_rate:>9.1%} {rate / 1000:>10.1f}')
+        finally:
+            shutil.rmtree(directory)
+
+    def measure(self, cache, options):
+        operations = options['operations']
+        value = 'x' * options['size']
+        keys = [f'key:{number}' for number in range(operations)]
+        rates = []
+        started = time.perf_counter()
+        for key in keys:
+            cache.set(key, value)
+        rates.append(operations / (time.perf_counter() - started))
+        started = time.perf_counter()
+        for key in keys:
+            cache.get(key)
+        rates.append(operations / (time.perf_counter() - started))
+        cache.set('counter', 0)
+        started = time.perf_counter()
+        for _ in range(operations):
+            cache.incr('counter')
+        rates.append(operations / (time.perf_counter() - started))
+        return rates
+
+    def measure_workers(self, name, directory, options):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(target=run_worker,
+                            args=(name, directory, options, seed, results))
+            for seed in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        stats = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        requests = options['requests'] * len(workers)
+        hits = sum(hit for hit, _ in stats)
+        elapsed = max(seconds for _, seconds in stats)
+        return hits / requests, requests / elapsed
@@ -0,0 +1,461 @@
+import io
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import (HTTPCookieProcessor, HTTPRedirectHandler,
+                            Request, build_opener)
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from PIL import Image
+
+from posts.models import Group, Post
+
+
+User = get_user_model()
+
+SCENARIOS = ('browse', 'follow_feed', 'create', 'comment', 'follow')
+DEFAULT_MIX = 'browse=60,follow_feed=15,create=5,comment=10,follow=10'
+# Сколько постов, групп и авторов берется из базы для адресов запросов
+TARGETS = 1000
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(value):
+    """'browse=60,create=5' -> {'browse': 60, 'create': 5}."""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise CommandError(f'Неизвестный сценарий {name}, '
+                               f'есть: {", ".join(SCENARIOS)}')
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f'Вес сценария {name} должен быть числом')
+    if not any(mix.values()):
+        raise CommandError('Хотя бы у одного сценария вес должен быть '
+                           'больше нуля')
+    return mix
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу из отсортированного списка."""
+    if not values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def compare(baseline, urls, tolerance, min_delta, error_tolerance):
+    """Описания регрессий итога urls относительно baseline."""
+    regressions = []
+    for name, row in urls.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ('p50', 'p95'):
+            if base[key] is None or row[key] is None:
+                continue
+            if (row[key] > base[key] * (1 + tolerance)
+                    and row[key] - base[key] >= min_delta):
+                regressions.append(f'{name}: {key} {base[key]} -> '
+                                   f'{row[key]} мс')
+        if row['error_rate'] > base['error_rate'] + error_tolerance:
+            regressions.append(f'{name}: ошибки {base["error_rate"]:.1%} '
+                               f'-> {row["error_rate"]:.1%}')
+    total, base = urls['total'], baseline['total']
+    if total['rps'] < base['rps'] * (1 - tolerance):
+        regressions.append(f'total: запросов в секунду {base["rps"]} -> '
+                           f'{total["rps"]}')
+    return regressions
+
+
+def make_image(size):
+    """JPEG из шума: плохо сжимается, как настоящая фотография."""
+    image = Image.effect_noise((size, size * 3 // 4), 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def stamp_image(content):
+    """
+    Та же картинка JPEG с уникальным комментарием (сегмент COM сразу
+    после SOI). Хранилище складывает файлы по хэшу содержимого, и без
+    метки все загрузки теста стали бы одним файлом с готовыми
+    миниатюрами. Пережимать картинку на каждый запрос не нужно.
+    """
+    stamp = uuid.uuid4().hex.encode()
+    return (content[:2] + b'\xff\xfe' + struct.pack('>H', len(stamp) + 2)
+            + stamp + content[2:])
+
+
+def multipart(fields, files):
+    """Тело multipart/form-data и его Content-Type."""
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; '
+                   f'name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; '
+                   f'name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: {content_type}\r\n\r\n'.encode())
+        body.write(content + b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """Редирект - это ответ отдельного view, по нему не переходим."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Stats:
+    """Длительности ответов и ошибки по именам адресов."""
+
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.durations = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, name, duration, error):
+        self.requests[name] += 1
+        if duration is not None:
+            self.durations[name].append(duration)
+        if error:
+            self.errors[name] += 1
+
+    def merge(self, other):
+        for name, requests in other.requests.items():
+            self.requests[name] += requests
+        for name, durations in other.durations.items():
+            self.durations[name].extend(durations)
+        for name, errors in other.errors.items():
+            self.errors[name] += errors
+
+    def summary(self, elapsed):
+        """
+        Для каждого имени и для всех запросов вместе: число запросов,
+        запросов в секунду, процентили в мс и доля ошибок.
+        """
+        result = {name: self.row(self.requests[name], self.durations[name],
+                                 self.errors[name], elapsed)
+                  for name in sorted(self.requests)}
+        result['total'] = self.row(
+            sum(self.requests.values()),
+            [duration for durations in self.durations.values()
+             for duration in durations],
+            sum(self.errors.values()), elapsed)
+        return result
+
+    @staticmethod
+    def row(requests, durations, errors, elapsed):
+        # У сетевых ошибок нет длительности, в процентили они не входят
+        durations = sorted(durations)
+        row = {
+            'requests': requests,
+            'rps': round(requests / elapsed, 2),
+            'error_rate': round(errors / requests, 4) if requests else 0,
+        }
+        for percent in PERCENTILES:
+            value = percentile(durations, percent)
+            row[f'p{percent}'] = (None if value is None
+                                  else round(value * 1000, 2))
+        return row
+
+
+class Client:
+    """Сессия одного посетителя: свои cookie и свой CSRF-токен."""
+
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies),
+                                   NoRedirect())
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, name, args=(), query=None, data=None, files=None):
+        """
+        Запрос к адресу с именем name; в статистику попадает под этим
+        именем. Ответы 4xx, 5xx и сетевые сбои считаются ошибками.
+        """
+        url = self.base_url + reverse(name, args=args)
+        if query:
+            url += '?' + urlencode(query)
+        headers = {}
+        body = None
+        if data is not None or files:
+            headers['X-CSRFToken'] = self.csrf_token()
+            if files:
+                body, headers['Content-Type'] = multipart(data or {},
+                                                          files)
+            else:
+                body = urlencode(data).encode()
+                headers['Content-Type'] = ('application/'
+                                           'x-www-form-urlencoded')
+        started = time.perf_counter()
+        try:
+            with self.opener.open(Request(url, body, headers),
+                                  timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            error.read()
+            status = error.code
+        except (URLError, OSError):
+            self.stats.add(name, None, True)
+            return None
+        self.stats.add(name, time.perf_counter() - started, status >= 400)
+        return status
+
+    def login(self, username, password):
+        self.request('users:login')
+        status = self.request('users:login', data={
+            'username': username, 'password': password})
+        if status != 302:
+            raise CommandError(f'Не удалось войти как {username}')
+
+
+class Worker(threading.Thread):
+    """Поток, который до истечения времени выполняет сценарии по весам."""
+
+    def __init__(self, command, number, deadline):
+        super().__init__(name=f'load-{number}')
+        self.command = command
+        self.options = command.options
+        self.deadline = deadline
+        self.rnd = random.Random(self.options['seed'] + number)
+        self.stats = Stats()
+        self.anonymous = Client(self.options['url'], self.stats,
+                                self.options['timeout'])
+        self.user = Client(self.options['url'], self.stats,
+                           self.options['timeout'])
+        self.username = command.usernames[number]
+        self.error = None
+
+    def run(self):
+        try:
+            self.user.login(self.username, self.options['password'])
+            names = list(self.command.mix)
+            weights = list(self.command.mix.values())
+            while time.monotonic() < self.deadline:
+                scenario = self.rnd.choices(names, weights)[0]
+                getattr(self, scenario)()
+        except Exception as error:
+            # Упавший поток не должен молча уменьшать нагрузку
+            self.error = error
+
+    def choice(self, values):
+        return self.rnd.choice(values) if values else None
+
+    def browse(self):
+        """Аноним листает ленту, пост, профиль автора и группу."""
+        self.anonymous.request('posts:index')
+        self.anonymous.request('posts:index', query={
+            'page': self.rnd.randint(2, 5)})
+        post = self.choice(self.command.posts)
+        if post:
+            self.anonymous.request('posts:post_detail', args=(post,))
+        author = self.choice(self.command.authors)
+        if author:
+            self.anonymous.request('posts:profile', args=(author,))
+        group = self.choice(self.command.groups)
+        if group:
+            self.anonymous.request('posts:group_list', args=(group,))
+
+    def follow_feed(self):
+        self.user.request('posts:follow_index')
+        self.user.request('posts:follow_index', query={'page': 2})
+
+    def create(self):
+        self.user.request('posts:post_create')
+        data = {'text': f'Нагрузочный пост {uuid.uuid4().hex}'}
+        group = self.choice(self.command.group_ids)
+        if group:
+            data['group'] = group
+        self.user.request('posts:post_create', data=data, files={
+            'image': ('load.jpg', stamp_image(self.command.image),
+                      'image/jpeg')})
+
+    def comment(self):
+        post = self.choice(self.command.posts)
+        if post is None:
+            return
+        self.user.request('posts:post_detail', args=(post,))
+        self.user.request('posts:add_comment', args=(post,), data={
+            'text': f'Нагрузочный комментарий {uuid.uuid4().hex}'})
+
+    def follow(self):
+        """Подписка и отписка: у каждого потока свой пользователь."""
+        author = self.choice(self.command.authors)
+        if author is None or author == self.username:
+            return
+        self.user.request('posts:profile_follow', args=(author,))
+        self.user.request('posts:profile_unfollow', args=(author,))
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест запущенного сервера проекта: несколько '
+            'потоков выполняют сценарии посетителей, итог - запросы в '
+            'секунду, p50/p95/p99 и доля ошибок по именам адресов. '
+            'Итог можно сохранить как базовый и сравнивать с ним '
+            'следующие прогоны. Адреса берутся из этой же базы, '
+            'например после generate_data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Число одновременных посетителей')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Длительность в секундах')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='Веса сценариев: '
+                                 + ', '.join(SCENARIOS))
+        parser.add_argument('--prefix', default='load',
+                            help='Префикс имен пользователей теста')
+        parser.add_argument('--password', default='load-test-password')
+        parser.add_argument('--image-size', type=int, default=1024,
+                            help='Ширина загружаемой картинки')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', dest='json_path',
+                            help='Записать итог в файл JSON')
+        parser.add_argument('--save-baseline',
+                            help='Сохранить итог как базовый')
+        parser.add_argument('--baseline',
+                            help='Сравнить с базовым итогом и завершиться '
+                                 'с ошибкой при регрессии')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p50/p95 и падение '
+                                 'запросов в секунду, доля')
+        parser.add_argument('--min-delta', type=float, default=5,
+                            help='Рост задержки меньше этого числа мс '
+                                 'не считается регрессией')
+        parser.add_argument('--error-tolerance', type=float, default=0.01,
+                            help='Допустимый рост доли ошибок')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency должен быть больше нуля')
+        self.options = options
+        self.mix = parse_mix(options['mix'])
+        self.prepare()
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{options["concurrency"]} посетителей, '
+            f'{options["duration"]:g} с, {options["url"]}'))
+        stats, elapsed = self.run_workers()
+        result = {
+            'concurrency': options['concurrency'],
+            'mix': self.mix,
+            'duration': round(elapsed, 2),
+            'urls': stats.summary(elapsed),
+        }
+        self.report(result['urls'])
+        self.save(result)
+
+    def run_workers(self):
+        """
+        Запускает посетителей до конца --duration и возвращает их общую
+        статистику и время прогона. Ошибка любого потока - ошибка
+        команды.
+        """
+        started = time.monotonic()
+        deadline = started + self.options['duration']
+        workers = [Worker(self, number, deadline)
+                   for number in range(self.options['concurrency'])]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+        stats = Stats()
+        for worker in workers:
+            if isinstance(worker.error, CommandError):
+                raise worker.error
+            if worker.error is not None:
+                raise CommandError(
+                    f'Поток {worker.name} упал: {worker.error!r}'
+                ) from worker.error
+            stats.merge(worker.stats)
+        return stats, elapsed
+
+    def save(self, result):
+        """Пишет итог в --json и --save-baseline, сверяет с --baseline."""
+        for path in (self.options['json_path'],
+                     self.options['save_baseline']):
+            if path:
+                with open(path, 'w', encoding='utf-8') as file:
+                    json.dump(result, file, ensure_ascii=False, indent=2)
+        if self.options['baseline']:
+            self.check_baseline(result)
+
+    def prepare(self):
+        """Пользователи теста и адреса, по которым они будут ходить."""
+        options = self.options
+        self.usernames = []
+        for number in range(options['concurrency']):
+            user, _ = User.objects.get_or_create(
+                username=f'{options["prefix"]}_{number}')
+            if not user.check_password(options['password']):
+                user.set_password(options['password'])
+                user.save(update_fields=('password',))
+            self.usernames.append(user.username)
+        recent = list(Post.objects.order_by('-pk')
+                      .values_list('pk', 'author__username')[:TARGETS])
+        self.posts = [pk for pk, _ in recent]
+        # Авторы свежих постов; частые встречаются в списке чаще
+        self.authors = [username for _, username in recent]
+        groups = list(Group.objects.values_list('pk', 'slug')[:TARGETS])
+        self.group_ids = [pk for pk, _ in groups]
+        self.groups = [slug for _, slug in groups]
+        self.image = make_image(options['image_size'])
+
+    def report(self, urls):
+        self.stdout.write(
+            f'{"":<28} {"запросов":>9} {"в с":>8} {"p50 мс":>8} '
+            f'{"p95 мс":>8} {"p99 мс":>8} {"ошибки":>7}')
+        for name, row in urls.items():
+            latencies = ' '.join(
+                f'{"-" if row[key] is None else row[key]:>8}'
+                for key in ('p50', 'p95', 'p99'))
+            self.stdout.write(
+                f'{name:<28} {row["requests"]:>9} {row["rps"]:>8} '
+                f'{latencies} {row["error_rate"]:>7.1%}')
+
+    def check_baseline(self, result):
+        with open(self.options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)
+        if (baseline['concurrency'] != result['concurrency']
+                or baseline['mix'] != result['mix']):
+            self.stderr.write('Базовый прогон сделан с другими '
+                              '--concurrency или --mix')
+        regressions = compare(baseline['urls'], result['urls'],
+                              self.options['tolerance'],
+                              self.options['min_delta'],
+                              self.options['error_tolerance'])
+        if regressions:
+            raise CommandError('Регрессия относительно базового прогона:\n'
+                               + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно базового прогона нет'))
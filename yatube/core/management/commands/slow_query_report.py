@@ -0,0 +1,59 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import slow_queries
+
+
+class Command(BaseCommand):
+    help = ('Сводка журнала медленных запросов: запросы сгруппированы '
+            'по отпечатку и отсортированы по суммарному времени')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='По умолчанию SLOW_QUERY_LOG')
+        parser.add_argument('--limit', type=int, default=10,
+                            help='Сколько групп вывести')
+        parser.add_argument('--since',
+                            help='Учитывать записи начиная с этого времени '
+                                 '(ISO 8601)')
+        parser.add_argument('--clear', action='store_true',
+                            help='Очистить журнал после вывода')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.SLOW_QUERY_LOG
+        groups = {}
+        for record in slow_queries.read(path):
+            if options['since'] and record['time'] < options['since']:
+                continue
+            group = groups.setdefault(record['fingerprint'], {
+                'sql': record['sql'], 'count': 0, 'total': 0.0,
+                'max': 0.0, 'views': Counter(), 'plan': None,
+                'example': record['example'],
+            })
+            group['count'] += 1
+            group['total'] += record['duration_ms']
+            group['views'][record['view']] += 1
+            if record['duration_ms'] >= group['max']:
+                group['max'] = record['duration_ms']
+                group['example'] = record['example']
+                group['plan'] = record['plan'] or group['plan']
+
+        if not groups:
+            self.stdout.write('Медленных запросов нет')
+        ranked = sorted(groups.items(), key=lambda item: -item[1]['total'])
+        for fingerprint, group in ranked[:options['limit']]:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{fingerprint}: {group["count"]} раз, всего '
+                f'{group["total"]:.1f} мс, в среднем '
+                f'{group["total"] / group["count"]:.1f} мс, максимум '
+                f'{group["max"]:.1f} мс'))
+            self.stdout.write(group['sql'])
+            views = ', '.join(f'{view} ({count})' for view, count
+                              in group['views'].most_common())
+            self.stdout.write(f'view: {views}')
+            for line in group['plan'] or ():
+                self.stdout.write(f'  {line}')
+
+        if options['clear']:
+            open(path, 'w').close()
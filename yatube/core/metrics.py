@@ -0,0 +1,303 @@
+"""
+Метрики в текстовом формате Prometheus.
+
+Каждый процесс-воркер пишет значения в свой файл METRICS_DIR/<pid>.db,
+отображенный в память: писатель у файла один, поэтому межпроцессные
+блокировки не нужны, а внутри процесса достаточно одного threading.Lock
+на короткое изменение числа. Эндпоинт /metrics/ читает и складывает
+файлы всех процессов. Без METRICS_DIR значения хранятся в памяти
+процесса (тесты, runserver).
+
+Файлы остановленных воркеров не удаляются: счетчики накопительные, и
+их значения остаются в сумме. Каталог нужно очищать при каждом
+перезапуске сервиса.
+"""
+import glob
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+
+INITIAL_SIZE = 64 * 1024
+HEADER = struct.Struct('<Q')
+KEY_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def entry_size(key):
+    """Длина записи: длина ключа, ключ, выравнивание до 8 байт, число."""
+    size = KEY_LENGTH.size + len(key)
+    return size + (-size % 8) + VALUE.size
+
+
+def read_entries(data):
+    """Выдает (ключ, смещение числа) записей файла значений."""
+    used = HEADER.unpack_from(data)[0]
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(data, position)[0]
+        key = bytes(data[position + KEY_LENGTH.size:
+                         position + KEY_LENGTH.size + length])
+        size = entry_size(key)
+        yield key.decode(), position + size - VALUE.size
+        position += size
+
+
+def read_values(path):
+    """Значения из файла процесса; файл читается без блокировок."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        return {}
+    return {key: VALUE.unpack_from(data, offset)[0]
+            for key, offset in read_entries(data)}
+
+
+class MemoryValues:
+    """Значения метрик в памяти процесса."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class MmapValues:
+    """
+    Значения метрик процесса в файле, отображенном в память.
+    Новая запись сначала дописывается целиком, и только потом
+    в заголовке растет длина занятой части, поэтому читатель
+    никогда не видит недописанную запись.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INITIAL_SIZE:
+            self._file.truncate(INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        used = HEADER.unpack_from(self._map)[0]
+        if used == 0:
+            used = HEADER.size
+            HEADER.pack_into(self._map, 0, used)
+        self._used = used
+        self._positions = dict(read_entries(self._map))
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._append(key)
+            value = VALUE.unpack_from(self._map, position)[0]
+            VALUE.pack_into(self._map, position, value + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        size = entry_size(encoded)
+        if self._used + size > len(self._map):
+            self._grow(self._used + size)
+        start = self._used
+        KEY_LENGTH.pack_into(self._map, start, len(encoded))
+        self._map[start + KEY_LENGTH.size:
+                  start + KEY_LENGTH.size + len(encoded)] = encoded
+        position = start + size - VALUE.size
+        VALUE.pack_into(self._map, position, 0.0)
+        self._used += size
+        HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def collect(self):
+        return read_values(self.path)
+
+
+class Registry:
+    """Набор метрик и хранилище их значений для текущего процесса."""
+
+    def __init__(self):
+        self.metrics = []
+        self._values = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    @property
+    def values(self):
+        # После fork у дочернего процесса должен быть свой файл
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._values = self._open()
+                    self._pid = os.getpid()
+        return self._values
+
+    def _open(self):
+        directory = settings.METRICS_DIR
+        if not directory:
+            return MemoryValues()
+        os.makedirs(directory, exist_ok=True)
+        return MmapValues(os.path.join(directory, f'{os.getpid()}.db'))
+
+    def reset(self):
+        """Начинает значения заново (для тестов и смены METRICS_DIR)."""
+        self._pid = None
+
+    def collect(self):
+        """Сумма значений всех процессов."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return self.values.collect()
+        totals = {}
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            for key, value in read_values(path).items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self):
+        """Текст для /metrics/ в формате Prometheus 0.0.4."""
+        values = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for key in sorted((key for key in values
+                               if metric.owns(key)), key=metric.sort_key):
+                lines.append(f'{key} {format_value(values[key])}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def sample_key(name, labels):
+    if not labels:
+        return name
+    pairs = ','.join(f'{label}="{escape(value)}"'
+                     for label, value in labels)
+    return f'{name}{{{pairs}}}'
+
+
+class Metric:
+    type = None
+    suffixes = ('',)
+
+    def __init__(self, name, documentation, labelnames=(),
+                 registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: нужны метки {self.labelnames}')
+        return [(label, labels[label]) for label in self.labelnames]
+
+    def owns(self, key):
+        return any(key.split('{', 1)[0] == self.name + suffix
+                   for suffix in self.suffixes)
+
+    def sort_key(self, key):
+        return key
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.values.add(
+            sample_key(self.name, self.labels(labels)), amount)
+
+
+class Histogram(Metric):
+    """Гистограмма с накопительными корзинами, как того ждет Prometheus."""
+    type = 'histogram'
+    suffixes = ('_bucket', '_sum', '_count')
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        # Нулем тоже прибавляем: каждая корзина появляется в выводе
+        # с первого наблюдения набора меток
+        labels = self.labels(labels)
+        values = self.registry.values
+        for bound in self.buckets:
+            le = '+Inf' if bound == float('inf') else format_value(bound)
+            values.add(sample_key(f'{self.name}_bucket',
+                                  labels + [('le', le)]),
+                       1 if value <= bound else 0)
+        values.add(sample_key(f'{self.name}_sum', labels), value)
+        values.add(sample_key(f'{self.name}_count', labels), 1)
+
+    def sort_key(self, key):
+        """
+        Набор меток, затем корзины по возрастанию le (+Inf последней),
+        _sum и _count.
+        """
+        name, _, labels = key.partition('{')
+        suffix = name[len(self.name):]
+        bound = 0.0
+        if suffix == '_bucket':
+            labels, _, le = labels.rpartition('le="')
+            bound = float(le[:-len('"}')])
+        return (labels.rstrip(',}'), self.suffixes.index(suffix), bound)
+
+
+REQUESTS = Counter(
+    'yatube_requests_total', 'Обработанные запросы',
+    ('view', 'method', 'status'))
+REQUEST_SECONDS = Histogram(
+    'yatube_request_duration_seconds', 'Время обработки запроса',
+    ('view',))
+REQUEST_QUERIES = Histogram(
+    'yatube_request_db_queries', 'SQL-запросов на один HTTP-запрос',
+    ('view',), buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+CACHE_EVENTS = Counter(
+    'yatube_cache_events_total',
+    'Попадания и промахи кэша страниц и фрагментов', ('cache', 'event'))
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_generation_seconds',
+    'Время подготовки всех миниатюр одной картинки',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+UPLOAD_BYTES = Histogram(
+    'yatube_upload_size_bytes', 'Размер загруженных картинок',
+    buckets=(10 ** 4, 10 ** 5, 5 * 10 ** 5, 10 ** 6, 5 * 10 ** 6, 10 ** 7))
@@ -0,0 +1,154 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.urls import reverse
+from django.utils import timezone
+
+from . import metrics, timing
+from .models import RequestProfile
+from .profiler import Sampler
+from .slow_queries import SlowQueryLog
+
+
+logger = logging.getLogger('core.timing')
+
+
+class QueryCounter:
+    """execute_wrapper, считающий SQL-запросы."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Считает для core.metrics каждый запрос: число ответов по view,
+    методу и статусу, время обработки и число SQL-запросов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        view = getattr(request.resolver_match, 'view_name', None)
+        view = view or '<unresolved>'
+        metrics.REQUESTS.inc(view=view, method=request.method,
+                             status=response.status_code)
+        metrics.REQUEST_SECONDS.observe(duration, view=view)
+        metrics.REQUEST_QUERIES.observe(counter.count, view=view)
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    Для доли SERVER_TIMING_SAMPLE_RATE запросов замеряет SQL, рендер
+    шаблонов, кэш и общее время, отдает их в заголовке Server-Timing
+    и пишет строкой JSON в лог core.timing. Остальные запросы
+    проходят без замеров и почти без накладных расходов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        timings = timing.Timings()
+        token = timing.activate(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute))
+                response = self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        timings.finish()
+        response['Server-Timing'] = timings.header()
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            **timings.as_dict(),
+        }, ensure_ascii=False))
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Записывает в SLOW_QUERY_LOG запросы к базе дольше
+    SLOW_QUERY_THRESHOLD секунд вместе с их планом и view.
+    None в SLOW_QUERY_THRESHOLD отключает журнал.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.SLOW_QUERY_THRESHOLD is None:
+            return self.get_response(request)
+        wrapper = SlowQueryLog(request, settings.SLOW_QUERY_THRESHOLD,
+                               settings.SLOW_QUERY_LOG)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            return self.get_response(request)
+
+
+class ProfilerMiddleware:
+    """
+    Снимает профиль запроса с параметром ?profile, если его делает
+    сотрудник (is_staff). Профиль сохраняется как RequestProfile,
+    ссылка на него в админке отдается в заголовке X-Profile.
+    Должен стоять после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if 'profile' not in request.GET or not request.user.is_staff:
+            return self.get_response(request)
+        sampler = Sampler(settings.PROFILER_INTERVAL)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - started
+        view_name = getattr(request.resolver_match, 'view_name', '')
+        profile = RequestProfile(
+            user=request.user,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            view_name=view_name,
+            status=response.status_code,
+            duration=round(duration * 1000, 1),
+            samples=sampler.samples,
+        )
+        name = '{}-{}.folded'.format(
+            timezone.now().strftime('%Y%m%d-%H%M%S'),
+            view_name.replace(':', '-') or 'unresolved')
+        profile.file.save(name, ContentFile(sampler.folded().encode()))
+        response['X-Profile'] = reverse('admin:core_requestprofile_change',
+                                        args=(profile.pk,))
+        return response
@@ -0,0 +1,320 @@
+"""
+Кэш в файле, отображенном в память (mmap), общий для всех процессов
+на одном хосте.
+
+Файл разбит на слоты одинакового размера, слоты сгруппированы в наборы
+по WAYS штук. Ключ всегда попадает в один набор (по хэшу), внутри
+набора ищется линейно, а при нехватке места вытесняется запись с самым
+старым временем последнего обращения (LRU в пределах набора).
+Набор блокируется через fcntl.lockf на его диапазон байт, поэтому
+процессы, работающие с разными наборами, друг другу не мешают. Потоки
+одного процесса fcntl не разделяет, для них наборы закрыты
+threading.Lock из LOCK_STRIPES штук, выбираемым по номеру набора.
+
+Геометрия файла (SLOTS, SLOT_SIZE) записана в его заголовке. Чтобы
+ее сменить, нужно остановить все процессы и удалить файл или указать
+другой LOCATION: урезать файл, отображенный другими процессами,
+нельзя, они получат SIGBUS.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.mmap_cache.MmapCache',
+            'LOCATION': '/var/tmp/yatube.cache',
+            'OPTIONS': {'SLOTS': 4096, 'SLOT_SIZE': 65536},
+        }
+    }
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+
+MAGIC = b'YTMC0001'
+# magic, число слотов, размер слота
+FILE_HEADER = struct.Struct('<8sII')
+FILE_HEADER_SIZE = 64
+# хэш ключа, срок жизни (0 - бессрочно), последнее обращение,
+# длина ключа, длина значения, флаги
+SLOT_HEADER = struct.Struct('<QddHIB')
+SLOT_HEADER_SIZE = 32
+WAYS = 8
+LOCK_STRIPES = 64
+
+FLAG_USED = 1
+FLAG_COMPRESSED = 2
+COMPRESS_MIN_SIZE = 1024
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+class SharedFile:
+    """Отображенный в память файл кэша, один на процесс."""
+
+    def __init__(self, path, slots, slot_size):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        size = FILE_HEADER_SIZE + slots * slot_size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, FILE_HEADER_SIZE, 0)
+        try:
+            header = os.pread(self.fd, FILE_HEADER.size, 0)
+            if not header:
+                # Новый файл: заголовок пишется под блокировкой, поэтому
+                # другие процессы видят либо пустой файл, либо готовый
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, FILE_HEADER.pack(MAGIC, slots, slot_size),
+                          0)
+            valid = (len(header) == 0 or (
+                len(header) == FILE_HEADER.size
+                and FILE_HEADER.unpack(header) == (MAGIC, slots, slot_size)))
+            if valid:
+                self.map = mmap.mmap(self.fd, size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, FILE_HEADER_SIZE, 0)
+        if not valid:
+            os.close(self.fd)
+            raise ImproperlyConfigured(
+                f'{path} создан с другими SLOTS и SLOT_SIZE или не '
+                f'является файлом кэша: остановите все процессы и '
+                f'удалите его или укажите другой LOCATION')
+        self.slots = slots
+        self.slot_size = slot_size
+        self.sets = max(slots // WAYS, 1)
+        self.thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def get_shared_file(path, slots, slot_size):
+    with _files_lock:
+        shared = _files.get(path)
+        if shared is None or shared.map.closed:
+            shared = _files[path] = SharedFile(path, slots, slot_size)
+        elif (shared.slots, shared.slot_size) != (slots, slot_size):
+            raise ImproperlyConfigured(
+                f'{path} уже открыт с другими SLOTS и SLOT_SIZE')
+        return shared
+
+
+class SetLock:
+    """Блокирует набор слотов от других потоков и процессов."""
+
+    def __init__(self, shared, number):
+        self.shared = shared
+        self.thread_lock = shared.thread_locks[number % LOCK_STRIPES]
+        self.start = FILE_HEADER_SIZE + number * WAYS * shared.slot_size
+        self.length = WAYS * shared.slot_size
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        fcntl.lockf(self.shared.fd, fcntl.LOCK_EX, self.length, self.start)
+
+    def __exit__(self, *exc_info):
+        fcntl.lockf(self.shared.fd, fcntl.LOCK_UN, self.length, self.start)
+        self.thread_lock.release()
+
+
+class MmapCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.slots = int(options.get('SLOTS', 4096))
+        self.slot_size = int(options.get('SLOT_SIZE', 64 * 1024))
+
+    @property
+    def shared(self):
+        return get_shared_file(self.location, self.slots, self.slot_size)
+
+    # Работа со слотами
+
+    def _hash(self, key):
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return struct.unpack('<Q', digest)[0]
+
+    def _slot_offsets(self, shared, key_hash):
+        number = key_hash % shared.sets
+        first = FILE_HEADER_SIZE + number * WAYS * shared.slot_size
+        return number, [first + way * shared.slot_size
+                        for way in range(WAYS)]
+
+    def _find(self, shared, offsets, key, key_hash, now):
+        """
+        Ищет слот с ключом, а также слот для новой записи: свободный
+        или, если свободных нет, самый давно использованный.
+        Просроченные записи по пути освобождаются.
+        """
+        found = free = oldest = None
+        oldest_used = 0.0
+        for offset in offsets:
+            (slot_hash, expires, last_used, key_length, _,
+             flags) = SLOT_HEADER.unpack_from(shared.map, offset)
+            if flags & FLAG_USED and expires and expires <= now:
+                self._clear_slot(shared, offset)
+                flags = 0
+            if not flags & FLAG_USED:
+                if free is None:
+                    free = offset
+                continue
+            start = offset + SLOT_HEADER_SIZE
+            if (found is None and slot_hash == key_hash
+                    and shared.map[start:start + key_length] == key):
+                found = offset
+            elif oldest is None or last_used < oldest_used:
+                oldest, oldest_used = offset, last_used
+        return found, free if free is not None else oldest
+
+    def _read(self, shared, offset):
+        """
+        Значение и срок жизни записи или None, если запись испорчена
+        (например, процесс упал посреди записи). Испорченный слот
+        освобождается, и чтение считается промахом.
+        """
+        (_, expires, _, key_length, value_length,
+         flags) = SLOT_HEADER.unpack_from(shared.map, offset)
+        start = offset + SLOT_HEADER_SIZE + key_length
+        data = shared.map[start:start + value_length]
+        try:
+            if flags & FLAG_COMPRESSED:
+                data = zlib.decompress(data)
+            # На мусоре pickle падает с самыми разными исключениями
+            return pickle.loads(data), expires
+        except Exception:
+            self._clear_slot(shared, offset)
+            return None
+
+    def _write(self, shared, offset, key, key_hash, value, expires, now):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        flags = FLAG_USED
+        if len(data) >= COMPRESS_MIN_SIZE:
+            data = zlib.compress(data)
+            flags |= FLAG_COMPRESSED
+        if len(key) + len(data) > shared.slot_size - SLOT_HEADER_SIZE:
+            return False
+        start = offset + SLOT_HEADER_SIZE
+        shared.map[start:start + len(key)] = key
+        shared.map[start + len(key):start + len(key) + len(data)] = data
+        SLOT_HEADER.pack_into(shared.map, offset, key_hash, expires, now,
+                              len(key), len(data), flags)
+        return True
+
+    def _touch_slot(self, shared, offset, now):
+        # last_used лежит сразу за хэшем ключа и сроком жизни
+        struct.pack_into('<d', shared.map, offset + 16, now)
+
+    def _clear_slot(self, shared, offset):
+        shared.map[offset:offset + SLOT_HEADER_SIZE] = bytes(
+            SLOT_HEADER_SIZE)
+
+    def _expires(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return 0.0 if expires is None else expires
+
+    def _prepare(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        key = key.encode()
+        return key, self._hash(key)
+
+    # API кэша Django
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(key, value, timeout, version, only_new=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, timeout, version)
+
+    def _store(self, key, value, timeout, version, only_new=False):
+        key, key_hash = self._prepare(key, version)
+        shared = self.shared
+        now = time.time()
+        number, offsets = self._slot_offsets(shared, key_hash)
+        with SetLock(shared, number):
+            found, victim = self._find(shared, offsets, key, key_hash, now)
+            if found is not None and only_new:
+                return False
+            offset = victim if found is None else found
+            expires = self._expires(timeout)
+            if expires and expires <= now:
+                if found is not None:
+                    self._clear_slot(shared, found)
+                return not only_new
+            stored = self._write(shared, offset, key, key_hash, value,
+                                 expires, now)
+            if not stored and found is not None:
+                self._clear_slot(shared, found)
+            return stored
+
+    def get(self, key, default=None, version=None):
+        key, key_hash = self._prepare(key, version)
+        shared = self.shared
+        now = time.time()
+        number, offsets = self._slot_offsets(shared, key_hash)
+        with SetLock(shared, number):
+            found, _ = self._find(shared, offsets, key, key_hash, now)
+            if found is None:
+                return default
+            entry = self._read(shared, found)
+            if entry is None:
+                return default
+            self._touch_slot(shared, found, now)
+        return entry[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key, key_hash = self._prepare(key, version)
+        shared = self.shared
+        now = time.time()
+        number, offsets = self._slot_offsets(shared, key_hash)
+        with SetLock(shared, number):
+            found, _ = self._find(shared, offsets, key, key_hash, now)
+            if found is None:
+                return False
+            struct.pack_into('<d', shared.map, found + 8,
+                             self._expires(timeout))
+            return True
+
+    def delete(self, key, version=None):
+        key, key_hash = self._prepare(key, version)
+        shared = self.shared
+        number, offsets = self._slot_offsets(shared, key_hash)
+        with SetLock(shared, number):
+            found, _ = self._find(shared, offsets, key, key_hash,
+                                  time.time())
+            if found is not None:
+                self._clear_slot(shared, found)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно (под блокировкой набора) увеличивает число."""
+        key, key_hash = self._prepare(key, version)
+        shared = self.shared
+        now = time.time()
+        number, offsets = self._slot_offsets(shared, key_hash)
+        with SetLock(shared, number):
+            found, _ = self._find(shared, offsets, key, key_hash, now)
+            entry = None if found is None else self._read(shared, found)
+            if entry is None:
+                raise ValueError(f"Key '{key.decode()}' not found")
+            value, expires = entry
+            value += delta
+            self._write(shared, found, key, key_hash, value, expires, now)
+        return value
+
+    def clear(self):
+        shared = self.shared
+        for number in range(shared.sets):
+            with SetLock(shared, number):
+                start = FILE_HEADER_SIZE + number * WAYS * shared.slot_size
+                for way in range(WAYS):
+                    self._clear_slot(shared, start + way * shared.slot_size)
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import models
+
+from .storage import ProfileStorage
+
+
+class RequestProfile(models.Model):
+    """Профиль одного запроса, снятый семплирующим профилировщиком"""
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='Дата')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='request_profiles',
+        verbose_name='Кто запросил',
+    )
+    method = models.CharField(max_length=10, verbose_name='Метод')
+    path = models.CharField(max_length=2000, verbose_name='Адрес')
+    view_name = models.CharField(max_length=200, blank=True,
+                                 verbose_name='View')
+    status = models.PositiveSmallIntegerField(verbose_name='Код ответа')
+    duration = models.FloatField(verbose_name='Длительность, мс')
+    samples = models.PositiveIntegerField(verbose_name='Выборок')
+    file = models.FileField(upload_to='%Y/%m/', storage=ProfileStorage(),
+                            verbose_name='Стеки (folded)')
+
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ('-created',)
+
+    def __str__(self) -> str:
+        return f'{self.view_name or self.path} ({self.created:%d.%m.%Y %H:%M})'
@@ -0,0 +1,124 @@
+"""
+Журнал медленных SQL-запросов.
+
+SlowQueryMiddleware (core.middleware) подключает к соединениям
+execute_wrapper, который замечает запросы дольше SLOW_QUERY_THRESHOLD
+секунд. Для каждого такого SELECT снимается план (EXPLAIN QUERY PLAN
+на SQLite), и в SLOW_QUERY_LOG дописывается строка JSON с отпечатком
+запроса, длительностью, планом и именем view. Команда slow_query_report
+группирует записи журнала по отпечаткам.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+from django.db import DatabaseError
+from django.utils import timezone
+
+
+logger = logging.getLogger('core.slow_queries')
+
+EXAMPLE_LENGTH = 2000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """
+    Приводит запрос к виду без конкретных значений: строки и числа
+    заменяются на ?, списки IN любой длины - на IN (...).
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode()).hexdigest()[:16]
+
+
+def explain(connection, sql, params):
+    """
+    План запроса отдельным курсором без execute_wrapper-ов, чтобы
+    не сбить результаты исходного запроса и не замерять сам EXPLAIN.
+    """
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    try:
+        prefix = connection.ops.explain_query_prefix()
+        cursor = connection.create_cursor()
+        try:
+            cursor.execute(f'{prefix} {sql}', params)
+            return [' '.join(str(value) for value in row)
+                    for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except DatabaseError:
+        return None
+
+
+def write(record, path):
+    """Дописывает запись строкой JSON; строка пишется одним write."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def read(path):
+    """Записи журнала; битые строки (например, недописанные) пропускаются."""
+    try:
+        file = open(path, encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+class SlowQueryLog:
+    """execute_wrapper, записывающий медленные запросы одного запроса."""
+
+    def __init__(self, request, threshold, path):
+        self.request = request
+        self.threshold = threshold
+        self.path = path
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - started
+        if duration >= self.threshold:
+            self.record(sql, params, many, duration, context['connection'])
+        return result
+
+    def record(self, sql, params, many, duration, connection):
+        match = self.request.resolver_match
+        record = {
+            'time': timezone.now().isoformat(),
+            'fingerprint': fingerprint(sql),
+            'sql': normalize(sql),
+            'example': sql[:EXAMPLE_LENGTH],
+            'duration_ms': round(duration * 1000, 1),
+            'view': match.view_name if match else None,
+            'path': self.request.path,
+            'plan': None if many else explain(connection, sql, params),
+        }
+        logger.warning('Медленный запрос %.1f мс в %s: %s',
+                       record['duration_ms'], record['view'], record['sql'])
+        try:
+            write(record, self.path)
+        except OSError:
+            logger.exception('Не удалось записать %s', self.path)
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+
+@deconstructible
+class HashedFileSystemStorage(FileSystemStorage):
+    """
+    Хранит файлы под именем, равным sha256 их содержимого:
+    upload_to/ab/cd/abcd...ef.jpg. Повторная загрузка того же файла
+    не записывается заново, а получает имя уже сохраненного, поэтому
+    и миниатюры sorl.thumbnail создаются для него один раз.
+    Хэш считается по кускам файла, целиком в память он не читается.
+
+    Две одновременные загрузки одного файла обе могут не найти его
+    в exists(), поэтому файл пишется под временным именем и ставится
+    на место жесткой ссылкой: os.link не перезаписывает готовый файл,
+    и вторая загрузка получает его имя, а не копию с суффиксом.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Имя по хэшу уже уникально; занятое имя - тот же файл
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        temporary = super()._save(
+            os.path.join(directory, f'.{uuid.uuid4().hex}.{filename}'),
+            content)
+        try:
+            os.link(self.path(temporary), self.path(name))
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(self.path(temporary))
+        return name
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()[:10]
+        return os.path.join(directory, digest[:2], digest[2:4],
+                            digest + extension)
+
+
+@deconstructible
+class ProfileStorage(FileSystemStorage):
+    """
+    Профили запросов в PROFILES_ROOT, вне MEDIA_ROOT: по ссылке
+    они не раздаются, скачать их можно только из админки.
+    """
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PROFILES_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PROFILES_ROOT)
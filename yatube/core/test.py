@@ -1,4 +1,51 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.core.management.base import CommandError
+from django.test import (LiveServerTestCase, RequestFactory, TestCase,
+                         override_settings)
+from django.urls import reverse
+from PIL import Image
+
+from core import metrics, slow_queries
+from core.management.commands import load_test
+from core.cache import bump, cache_feed, get_metrics, page_key
+from core.mmap_cache import SLOT_HEADER_SIZE, MmapCache, SharedFile
+from core.models import RequestProfile
+from core.profiler import folded_stack
+from core.storage import HashedFileSystemStorage
+from posts.models import Group, Post
+
+
+User = get_user_model()
+
+
+def make_mmap_cache(path, slots=64, slot_size=1024):
+    return MmapCache(path, {'OPTIONS': {'SLOTS': slots,
+                                        'SLOT_SIZE': slot_size}})
+
+
+def increment(path, times):
+    cache = make_mmap_cache(path)
+    for _ in range(times):
+        cache.incr('counter')
+
+
+def count_requests(counter, times):
+    for _ in range(times):
+        counter.inc(view='posts:index')
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +53,460 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class CacheFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.request = RequestFactory().get('/feed/')
+        self.request.user = AnonymousUser()
+
+        @cache_feed('feed:{slug}')
+        def feed(request, slug):
+            self.calls += 1
+            return HttpResponse(f'{slug} {self.calls}')
+
+        self.view = feed
+
+    def test_hit_after_miss(self):
+        self.view(self.request, slug='test')
+        response = self.view(self.request, slug='test')
+        self.assertEqual(response.content, b'test 1')
+        self.assertEqual(get_metrics('feed'),
+                         {'hit': 1, 'stale': 0, 'miss': 1})
+
+    def test_bump_recomputes_page(self):
+        self.view(self.request, slug='test')
+        bump('feed:test')
+        response = self.view(self.request, slug='test')
+        self.assertEqual(response.content, b'test 2')
+
+    def test_stale_copy_is_served_while_locked(self):
+        self.view(self.request, slug='test')
+        bump('feed:test')
+        cache.add(f'lock:{page_key(self.request)}', 1)
+        response = self.view(self.request, slug='test')
+        self.assertEqual(response.content, b'test 1')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(get_metrics('feed')['stale'], 1)
+
+    def test_missing_page_is_computed_after_short_wait_for_lock(self):
+        cache.add(f'lock:{page_key(self.request)}', 1)
+        started = time.monotonic()
+        response = self.view(self.request, slug='test')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.content, b'test 1')
+        self.assertIsNone(cache.get(page_key(self.request)))
+
+
+class MmapCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'test.cache')
+        self.cache = make_mmap_cache(self.path)
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 2))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 2)
+
+    def test_shared_between_instances(self):
+        self.cache.set('key', 'value')
+        other = make_mmap_cache(self.path)
+        self.assertEqual(other.get('key'), 'value')
+
+    def test_timeout(self):
+        self.cache.set('key', 'value', 0.05)
+        self.cache.set('forever', 'value', None)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get('forever'), 'value')
+
+    def test_large_values(self):
+        self.cache.set('compressed', 'x' * 100000)
+        self.assertEqual(self.cache.get('compressed'), 'x' * 100000)
+        self.cache.set('random', os.urandom(4096))
+        self.assertIsNone(self.cache.get('random'))
+
+    def test_lru_eviction(self):
+        cache = make_mmap_cache(self.path + '.lru', slots=8)
+        for number in range(8):
+            cache.set(f'key{number}', number)
+        cache.get('key0')
+        cache.set('key8', 8)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key8'), 8)
+
+    def test_incr(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter')
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 10), 11)
+        self.assertEqual(self.cache.decr('counter'), 10)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=increment, args=(self.path, 200))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 800)
+
+    def test_broken_entry_is_a_miss(self):
+        self.cache.set('key', 'value')
+        shared = self.cache.shared
+        key, key_hash = self.cache._prepare('key', None)
+        _, offsets = self.cache._slot_offsets(shared, key_hash)
+        found, _ = self.cache._find(shared, offsets, key, key_hash,
+                                    time.time())
+        # Недописанное значение: заголовок есть, данных нет
+        start = found + SLOT_HEADER_SIZE + len(key)
+        shared.map[start:start + 8] = bytes(8)
+        self.assertIsNone(self.cache.get('key'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('key')
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_other_geometry_is_refused(self):
+        self.cache.set('key', 'value')
+        with self.assertRaises(ImproperlyConfigured):
+            make_mmap_cache(self.path, slots=128).get('key')
+        with self.assertRaises(ImproperlyConfigured):
+            SharedFile(self.path, 128, 1024)
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_clear(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.cache.clear()
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+
+class HashedFileSystemStorageTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = HashedFileSystemStorage(location=directory.name)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('posts/first.GIF', ContentFile(b'image'))
+        second = self.storage.save('posts/second.gif', ContentFile(b'image'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith('posts/61/05/'))
+        self.assertTrue(first.endswith('.gif'))
+        self.assertEqual(self.storage.listdir('posts/61/05')[1], [
+            first.split('/')[3]])
+
+    def test_concurrent_uploads_of_same_content_are_stored_once(self):
+        # Обе загрузки прошли проверку exists() до записи файла
+        self.storage.exists = lambda name: False
+        first = self.storage.save('posts/first.gif', ContentFile(b'image'))
+        second = self.storage.save('posts/second.gif', ContentFile(b'image'))
+        self.assertEqual(first, second)
+        self.assertEqual(self.storage.listdir('posts/61/05')[1], [
+            first.split('/')[3]])
+
+    def test_different_content_gets_different_names(self):
+        first = self.storage.save('posts/image.gif', ContentFile(b'first'))
+        second = self.storage.save('posts/image.gif', ContentFile(b'second'))
+        self.assertNotEqual(first, second)
+        with self.storage.open(second) as file:
+            self.assertEqual(file.read(), b'second')
+
+
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def metrics(self, response):
+        return {part.split(';')[0]: part
+                for part in response['Server-Timing'].split(', ')}
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_sampled_request_is_measured(self):
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get(reverse('posts:index'))
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {'db', 'tpl', 'cache', 'total'})
+        self.assertIn('page_miss=1', metrics['cache'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['cache'], {'page_miss': 1})
+        self.assertIn(f'desc="{record["db_queries"]} queries"',
+                      metrics['db'])
+        self.assertGreater(record['template_ms'], 0)
+
+        response = self.client.get(reverse('posts:index'))
+        metrics = self.metrics(response)
+        self.assertIn('page_hit=1', metrics['cache'])
+        self.assertIn('desc="0 queries"', metrics['db'])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_request_outside_sample_is_not_measured(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'slow.log')
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            slow_queries.fingerprint(
+                "SELECT * FROM t WHERE id IN (%s, %s) AND name = 'a'"),
+            slow_queries.fingerprint(
+                "SELECT * FROM t WHERE id IN (%s)  AND name = 'bb'"))
+        self.assertEqual(
+            slow_queries.normalize('SELECT * FROM t LIMIT 21'),
+            'SELECT * FROM t LIMIT ?')
+
+    def test_slow_queries_are_logged_and_reported(self):
+        with override_settings(SLOW_QUERY_THRESHOLD=0,
+                               SLOW_QUERY_LOG=self.path):
+            self.client.get(reverse('posts:index'))
+            self.client.get(reverse('posts:index') + '?page=2')
+        records = list(slow_queries.read(self.path))
+        self.assertTrue(records)
+        self.assertEqual({record['view'] for record in records},
+                         {'posts:index'})
+        select = next(record for record in records
+                      if record['sql'].startswith('SELECT'))
+        self.assertTrue(select['plan'])
+
+        out = StringIO()
+        call_command('slow_query_report', path=self.path, clear=True,
+                     stdout=out)
+        self.assertIn(select['fingerprint'], out.getvalue())
+        self.assertIn('posts:index (2)', out.getvalue())
+        self.assertEqual(list(slow_queries.read(self.path)), [])
+
+    @override_settings(SLOW_QUERY_THRESHOLD=None)
+    def test_disabled_log_writes_nothing(self):
+        with override_settings(SLOW_QUERY_LOG=self.path):
+            self.client.get(reverse('posts:index'))
+        self.assertFalse(os.path.exists(self.path))
+
+
+class ProfilerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(PROFILES_ROOT=directory.name,
+                                     PROFILER_INTERVAL=0.001)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.staff = User.objects.create_user('staff', is_staff=True,
+                                              is_superuser=True)
+        self.client.force_login(self.staff)
+
+    def test_folded_stack_goes_from_outer_to_inner_call(self):
+        def inner():
+            return folded_stack(sys._getframe())
+
+        stack = inner().split(';')
+        self.assertTrue(stack[-1].startswith('inner (core/test.py:'))
+        self.assertTrue(stack[-2].startswith(
+            'test_folded_stack_goes_from_outer_to_inner_call'))
+
+    def test_staff_request_is_profiled(self):
+        response = self.client.get(reverse('posts:index') + '?profile=1')
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile'], reverse(
+            'admin:core_requestprofile_change', args=(profile.pk,)))
+        self.assertEqual(profile.view_name, 'posts:index')
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.status, 200)
+        with profile.file.open('rb') as file:
+            lines = file.read().decode().splitlines()
+        self.assertEqual(sum(int(line.rsplit(' ', 1)[1]) for line in lines),
+                         profile.samples)
+
+        response = self.client.get(
+            reverse('admin:core_requestprofile_changelist'))
+        self.assertContains(response, 'posts:index')
+        response = self.client.get(reverse(
+            'admin:core_requestprofile_download', args=(profile.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_other_users_are_not_profiled(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        response = self.client.get(reverse('posts:index') + '?profile=1')
+        self.assertFalse(response.has_header('X-Profile'))
+        self.client.logout()
+        self.client.get(reverse('posts:index') + '?profile=1')
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.registry = metrics.Registry()
+        self.counter = metrics.Counter('test_total', 'Тест', ('view',),
+                                       registry=self.registry)
+        self.histogram = metrics.Histogram('test_seconds', 'Тест',
+                                           ('view',), buckets=(0.5, 2.5, 10),
+                                           registry=self.registry)
+
+    def test_render(self):
+        self.counter.inc(view='posts:index')
+        self.counter.inc(2, view='posts:index')
+        self.histogram.observe(0.05, view='posts:index')
+        self.histogram.observe(0.5, view='posts:index')
+        self.histogram.observe(3, view='posts:index')
+        self.histogram.observe(20, view='posts:group_list')
+        self.assertEqual(self.registry.render().splitlines(), [
+            '# HELP test_total Тест',
+            '# TYPE test_total counter',
+            'test_total{view="posts:index"} 3',
+            '# HELP test_seconds Тест',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="posts:group_list",le="0.5"} 0',
+            'test_seconds_bucket{view="posts:group_list",le="2.5"} 0',
+            'test_seconds_bucket{view="posts:group_list",le="10"} 0',
+            'test_seconds_bucket{view="posts:group_list",le="+Inf"} 1',
+            'test_seconds_sum{view="posts:group_list"} 20',
+            'test_seconds_count{view="posts:group_list"} 1',
+            'test_seconds_bucket{view="posts:index",le="0.5"} 2',
+            'test_seconds_bucket{view="posts:index",le="2.5"} 2',
+            'test_seconds_bucket{view="posts:index",le="10"} 3',
+            'test_seconds_bucket{view="posts:index",le="+Inf"} 3',
+            'test_seconds_sum{view="posts:index"} 3.55',
+            'test_seconds_count{view="posts:index"} 3',
+        ])
+        with self.assertRaises(ValueError):
+            self.counter.inc(status=200)
+
+    def test_values_of_all_processes_are_summed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(METRICS_DIR=directory.name):
+            self.registry.reset()
+            self.counter.inc(view='posts:index')
+            context = multiprocessing.get_context('fork')
+            processes = [context.Process(target=count_requests,
+                                         args=(self.counter, 1000))
+                         for _ in range(3)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            self.assertEqual(len(os.listdir(directory.name)), 4)
+            self.assertEqual(self.registry.collect(),
+                             {'test_total{view="posts:index"}': 3001})
+        self.registry.reset()
+
+    def test_endpoint(self):
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(User.objects.create_user('staff',
+                                                         is_staff=True))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('yatube_requests_total{view="posts:index",'
+                      'method="GET",status="200"}', text)
+        self.assertIn('yatube_request_db_queries_count{view="posts:index"}',
+                      text)
+        self.assertIn('yatube_cache_events_total{cache="page",event="miss"}',
+                      text)
+
+    @override_settings(METRICS_ALLOWED_IPS=('127.0.0.1',))
+    def test_endpoint_for_allowed_ip(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class LoadTestTest(LiveServerTestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        author = User.objects.create_user('author')
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        Post.objects.create(author=author, group=group, text='Пост')
+
+    def test_percentile_and_compare(self):
+        values = list(range(1, 101))
+        self.assertEqual(load_test.percentile(values, 50), 50)
+        self.assertEqual(load_test.percentile(values, 99), 99)
+        self.assertIsNone(load_test.percentile([], 95))
+        baseline = {
+            'posts:index': {'p50': 10, 'p95': 20, 'error_rate': 0},
+            'total': {'p50': 10, 'p95': 20, 'error_rate': 0, 'rps': 100},
+        }
+        self.assertEqual(load_test.compare(
+            baseline, baseline, 0.2, 5, 0.01), [])
+        slower = {
+            'posts:index': {'p50': 12, 'p95': 40, 'error_rate': 0.05},
+            'total': {'p50': 12, 'p95': 40, 'error_rate': 0, 'rps': 70},
+        }
+        self.assertEqual(len(load_test.compare(
+            baseline, slower, 0.2, 5, 0.01)), 4)
+        with self.assertRaises(CommandError):
+            load_test.parse_mix('browse=1,unknown=2')
+
+    def test_uploads_are_unique(self):
+        image = load_test.make_image(64)
+        first, second = (load_test.stamp_image(image) for _ in range(2))
+        self.assertNotEqual(first, second)
+        for content in (first, second):
+            with Image.open(BytesIO(content)) as stamped:
+                stamped.load()
+                self.assertEqual(stamped.size, (64, 48))
+
+    def test_worker_failure_fails_command(self):
+        # Отрицательный таймаут - ValueError внутри urllib, не CommandError
+        with self.assertRaisesMessage(CommandError, 'load-0'):
+            call_command('load_test', url=self.live_server_url,
+                         concurrency=1, duration=1, timeout=-1,
+                         stdout=StringIO())
+
+    def test_run_saves_and_checks_baseline(self):
+        path = os.path.join(self.directory, 'baseline.json')
+        # При seed=1 первые пять сценариев - все пять разных
+        options = {'url': self.live_server_url, 'concurrency': 1,
+                   'duration': 1, 'seed': 1, 'image_size': 64,
+                   'mix': ','.join(load_test.SCENARIOS),
+                   'stdout': StringIO()}
+        call_command('load_test', save_baseline=path, **options)
+        with open(path) as file:
+            baseline = json.load(file)
+        urls = baseline['urls']
+        for name in ('posts:index', 'posts:follow_index',
+                     'posts:post_create', 'posts:add_comment',
+                     'posts:profile_follow', 'posts:profile_unfollow',
+                     'users:login'):
+            self.assertIn(name, urls)
+        self.assertEqual(urls['total']['error_rate'], 0)
+        self.assertTrue(Post.objects.filter(
+            author__username='load_0', image__startswith='posts/').exists())
+
+        urls['total']['rps'] = 10 ** 6
+        with open(path, 'w') as file:
+            json.dump(baseline, file)
+        with self.assertRaisesMessage(CommandError, 'total'):
+            call_command('load_test', baseline=path, stderr=StringIO(),
+                         **options)
@@ -0,0 +1,124 @@
+"""
+Замеры времени обработки запроса: SQL, шаблоны, кэш.
+
+ServerTimingMiddleware (core.middleware) создает для выбранного запроса
+объект Timings и кладет его в contextvar, а источники замеров
+дописывают в него свои данные:
+- SQL-запросы считает execute_wrapper каждого соединения;
+- время рендера шаблонов - бэкенд TimedDjangoTemplates;
+- попадания и промахи кэша - count_cache() в core.cache и фрагментах,
+  она же всегда пишет их в метрики core.metrics.
+Вне выбранного запроса все функции ничего не делают.
+"""
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+
+
+_current = ContextVar('timings', default=None)
+
+
+class Timings:
+    """Замеры одного запроса; времена в секундах."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = None
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        """execute_wrapper соединения: считает запросы и их время."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def header(self):
+        """Значение заголовка Server-Timing, длительности в мс."""
+        metrics = [
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="{self.db_queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ]
+        if self.cache:
+            events = ' '.join(f'{event}={number}' for event, number
+                              in sorted(self.cache.items()))
+            metrics.append(f'cache;desc="{events}"')
+        metrics.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 1),
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'template_ms': round(self.template_time * 1000, 1),
+            'cache': dict(self.cache),
+        }
+
+
+def current():
+    """Замеры текущего запроса или None, если он не выбран."""
+    return _current.get()
+
+
+def activate(timings):
+    return _current.set(timings)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def count_cache(name, event, number=1):
+    """
+    Учитывает событие (hit, miss, stale) кэша name в метриках
+    и в текущем запросе.
+    """
+    if not number:
+        return
+    metrics.CACHE_EVENTS.inc(number, cache=name, event=event)
+    timings = _current.get()
+    if timings is not None:
+        timings.cache[f'{name}_{event}'] += number
+
+
+class TimedTemplate(Template):
+    """Шаблон, время рендера которого попадает в Timings."""
+
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Обычный бэкенд шаблонов Django с замером рендера. Вложенные
+    {% include %} рендерятся внутри родителя и отдельно не считаются.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template,
+                             self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template,
+                             self)
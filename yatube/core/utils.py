@@ -1,24 +1,131 @@
+import base64
+import json
+
 from django.core.paginator import Paginator
-from yatube.settings import POSTS_PER_PAGE
-from posts.models import Follow
+from django.utils.dateparse import parse_datetime
+from yatube.settings import PAGINATION_MODE, POSTS_PER_PAGE
+
 
 def paginator(obj_list, request):
+    """
+    Возвращает страницу obj_list.
+    Если в запросе передан параметр cursor или в настройках включен
+    режим PAGINATION_MODE = 'cursor', используется курсорная пагинация,
+    иначе - обычная постраничная.
+    """
+    if PAGINATION_MODE == 'cursor' or 'cursor' in request.GET:
+        return cursor_paginator(obj_list, request)
     page_number = request.GET.get('page')
     return Paginator(obj_list, POSTS_PER_PAGE).get_page(page_number)
 
 
-def check_subscribed(user, author):
+def encode_cursor(pub_date, pk, direction):
+    """Упаковывает позицию (pub_date, id) в непрозрачный токен."""
+    raw = json.dumps([pub_date.isoformat(), pk, direction])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
     """
-    Если user подписан на author функция вернут True,
-    в противном случае вернет False
+    Распаковывает токен курсора.
+    Для пустого или испорченного токена вернет None.
     """
+    if not token:
+        return None
     try:
-        folows = Follow.objects.get(user=user, author=author)
-    except:
-        folows = None   
-    if isinstance(folows, Follow):
-        return True
-    else: False
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        pub_date, pk, direction = json.loads(raw)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (ValueError, TypeError):
+        return None
+    if pub_date is None or direction not in ('next', 'prev'):
+        return None
+    return pub_date, pk, direction
+
+
+def _cursor_key(obj, date_field):
+    if isinstance(obj, dict):
+        return obj[date_field], obj['id']
+    return getattr(obj, date_field), obj.pk
+
+
+class CursorPage:
+    """
+    Страница курсорной пагинации.
+    Не знает общего количества объектов и своего номера,
+    только есть ли записи новее и старше.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, has_previous, has_next,
+                 date_field='pub_date'):
+        self.object_list = object_list
+        self.date_field = date_field
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return encode_cursor(
+            *_cursor_key(self.object_list[0], self.date_field), 'prev')
+
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return encode_cursor(
+            *_cursor_key(self.object_list[-1], self.date_field), 'next')
+
+
+def cursor_paginator(obj_list, request, per_page=POSTS_PER_PAGE,
+                     date_field='pub_date'):
+    """
+    Курсорная (keyset) пагинация по (date_field, id), от новых к старым.
+    Не выполняет ни COUNT, ни OFFSET: каждая страница выбирается
+    условием по ключу последней записи предыдущей страницы.
+    """
+    cursor = decode_cursor(request.GET.get('cursor'))
+    queryset = obj_list.order_by(f'-{date_field}', '-id')
+    if cursor is None:
+        rows = list(queryset[:per_page + 1])
+        return CursorPage(rows[:per_page], False, len(rows) > per_page,
+                          date_field)
+    date, pk, direction = cursor
+    if direction == 'next':
+        rows = list(queryset.filter(
+            **{f'{date_field}__lte': date}).exclude(
+            **{date_field: date, 'id__gte': pk})[:per_page + 1])
+        return CursorPage(rows[:per_page], True, len(rows) > per_page,
+                          date_field)
+    rows = list(queryset.order_by(date_field, 'id').filter(
+        **{f'{date_field}__gte': date}).exclude(
+        **{date_field: date, 'id__lte': pk})[:per_page + 1])
+    page = rows[:per_page]
+    page.reverse()
+    return CursorPage(page, len(rows) > per_page, True, date_field)
+
 
 def check_subscription_button(user, author):
     """
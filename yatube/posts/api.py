@@ -0,0 +1,246 @@
+"""
+JSON API только для чтения: ленты, пост, комментарии.
+
+Записи выбираются через .values() ровно с теми столбцами, которые
+запрошены в ?fields=, и сериализуются из словарей, без создания
+моделей и обращений к связанным объектам. Ленты листаются курсором
+(?cursor=), ?ids= отдает несколько постов одним запросом.
+Публичные ответы кэшируются клиентами и прокси на API_CACHE_MAX_AGE
+секунд и проверяются по ETag из версий областей кэша страниц.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+
+from core.cache import versions_etag
+from core.utils import cursor_paginator
+from . import timelines
+from .models import Comment, Group, Post
+
+
+User = get_user_model()
+
+# Поле ответа -> поле для .values()
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'updated': 'updated',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'post': 'post_id',
+    'author': 'author__username',
+    'text': 'text',
+    'created': 'created',
+}
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def error_response(message, status):
+    return JsonResponse({'error': message}, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(view):
+    """
+    Общая обертка API: только GET и HEAD, ошибки APIError
+    превращаются в JSON-ответ с кодом ошибки.
+    """
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except APIError as error:
+            return error_response(str(error), error.status)
+    return wrapper
+
+
+def api_etag(*scopes):
+    """etag_func для condition(): ответ зависит только от областей."""
+    def etag(request, **kwargs):
+        return versions_etag(request,
+                             [scope.format(**kwargs) for scope in scopes])
+    return etag
+
+
+def ids_etag(request, **kwargs):
+    try:
+        ids = parse_ids(request)
+    except APIError:
+        return None
+    if ids is None:
+        return versions_etag(request, ['index'])
+    return versions_etag(request, [f'post:{pk}' for pk in ids])
+
+
+def post_etag(request, post_id):
+    """
+    ETag поста: в ответе есть имя автора и slug группы, поэтому кроме
+    версии поста учитываются версии профиля автора и группы, которые
+    меняются при их переименовании.
+    """
+    row = (Post.objects
+           .filter(pk=post_id)
+           .values_list('author__username', 'group__slug')
+           .first())
+    if row is None:
+        return None
+    username, slug = row
+    scopes = [f'post:{post_id}', f'profile:{username}']
+    if slug:
+        scopes.append(f'group:{slug}')
+    return versions_etag(request, scopes)
+
+
+public = cache_control(public=True, max_age=settings.API_CACHE_MAX_AGE)
+
+
+def parse_fields(request, fields):
+    """
+    Разбирает ?fields=a,b в список полей ответа.
+    Без параметра возвращаются все поля.
+    """
+    value = request.GET.get('fields')
+    if not value:
+        return list(fields)
+    names = [name for name in value.split(',') if name]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise APIError(f'Неизвестные поля: {", ".join(unknown)}')
+    return names
+
+
+def parse_ids(request):
+    """Разбирает ?ids=1,2,3; без параметра вернет None."""
+    value = request.GET.get('ids')
+    if value is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in value.split(',') if pk))
+    except ValueError:
+        raise APIError('ids должен быть списком чисел через запятую')
+    if len(ids) > settings.API_MAX_IDS:
+        raise APIError(f'Не больше {settings.API_MAX_IDS} ids за запрос')
+    return ids
+
+
+def select(queryset, fields, names, date_field=None):
+    """
+    .values() только с запрошенными столбцами. id и поле даты
+    выбираются всегда: по ним строится курсор.
+    """
+    columns = {fields[name] for name in names} | {'id'}
+    if date_field:
+        columns.add(date_field)
+    return queryset.values(*columns)
+
+
+def serialize(rows, fields, names):
+    """Переводит строки .values() в словари с полями ответа."""
+    storage = Post._meta.get_field('image').storage
+    results = []
+    for row in rows:
+        item = {name: row[fields[name]] for name in names}
+        if item.get('image'):
+            item['image'] = storage.url(item['image'])
+        results.append(item)
+    return results
+
+
+def page_response(request, queryset, fields=POST_FIELDS,
+                  date_field='pub_date'):
+    names = parse_fields(request, fields)
+    page = cursor_paginator(select(queryset, fields, names, date_field),
+                            request, settings.API_PAGE_SIZE, date_field)
+    return JsonResponse({
+        'results': serialize(page, fields, names),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+def get_id(queryset, **lookup):
+    """id объекта или APIError 404, без загрузки модели."""
+    pk = queryset.filter(**lookup).values_list('id', flat=True).first()
+    if pk is None:
+        raise APIError('Не найдено', status=404)
+    return pk
+
+
+@public
+@condition(etag_func=ids_etag)
+@api_view
+def posts(request):
+    """Лента всех постов или посты из ?ids= в порядке ids."""
+    ids = parse_ids(request)
+    if ids is None:
+        return page_response(request, Post.objects.all())
+    names = parse_fields(request, POST_FIELDS)
+    rows = {row['id']: row for row in select(
+        Post.objects.filter(id__in=ids), POST_FIELDS, names)}
+    return JsonResponse({
+        'results': serialize([rows[pk] for pk in ids if pk in rows],
+                             POST_FIELDS, names),
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@public
+@condition(etag_func=api_etag('group:{slug}'))
+@api_view
+def group_posts(request, slug):
+    group_id = get_id(Group.objects, slug=slug)
+    return page_response(request, Post.objects.filter(group=group_id))
+
+
+@public
+@condition(etag_func=api_etag('profile:{username}'))
+@api_view
+def profile_posts(request, username):
+    author_id = get_id(User.objects, username=username)
+    return page_response(request, Post.objects.filter(author=author_id))
+
+
+@cache_control(private=True, max_age=settings.API_CACHE_MAX_AGE)
+@api_view
+def follow_posts(request):
+    """Лента подписок текущего пользователя."""
+    if not request.user.is_authenticated:
+        raise APIError('Требуется авторизация', status=401)
+    return page_response(request, timelines.timeline(request.user))
+
+
+@public
+@condition(etag_func=post_etag)
+@api_view
+def post_detail(request, post_id):
+    names = parse_fields(request, POST_FIELDS)
+    row = select(Post.objects.filter(pk=post_id), POST_FIELDS, names).first()
+    if row is None:
+        raise APIError('Не найдено', status=404)
+    return JsonResponse(serialize([row], POST_FIELDS, names)[0],
+                        json_dumps_params={'ensure_ascii': False})
+
+
+@public
+@condition(etag_func=api_etag('post:{post_id}'))
+@api_view
+def post_comments(request, post_id):
+    """Комментарии поста, от новых к старым."""
+    get_id(Post.objects, pk=post_id)
+    return page_response(request, Comment.objects.filter(post=post_id),
+                         COMMENT_FIELDS, 'created')
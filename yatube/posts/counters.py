@@ -0,0 +1,120 @@
+"""
+Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики обновляются сигналами (см. posts.signals) в той же транзакции,
+что и изменение данных. Строка UserCounter создается вместе с
+пользователем (для прежних пользователей - миграцией 0013). Если ее
+все же нет, например пользователь вставлен в базу мимо моделей,
+bump_user создает ее пересчетом. Испорченные счетчики чинит команда
+recount_counters.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Follow, Post, UserCounter
+
+
+def get_counters(user):
+    """Возвращает счетчики пользователя, при необходимости создавая их."""
+    try:
+        return UserCounter.objects.get(user=user)
+    except UserCounter.DoesNotExist:
+        pass
+    return create_counters(user.pk)
+
+
+def create_counters(user_id):
+    """Создает строку счетчиков пользователя по исходным таблицам."""
+    try:
+        with transaction.atomic():
+            counters, _ = UserCounter.objects.get_or_create(
+                user_id=user_id, defaults=count_user(user_id))
+    except IntegrityError:
+        # Строку одновременно создал другой запрос
+        counters = UserCounter.objects.get(user_id=user_id)
+    return counters
+
+
+def count_user(user_id):
+    """Считает значения счетчиков пользователя по исходным таблицам."""
+    return {
+        'posts_count': Post.objects.filter(author=user_id).count(),
+        'followers_count': Follow.objects.filter(author=user_id).count(),
+        'following_count': Follow.objects.filter(user=user_id).count(),
+    }
+
+
+USER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def grouped_count(queryset, field):
+    return dict(queryset.order_by().values_list(field).annotate(Count('id')))
+
+
+def recount_users(ids):
+    """
+    Пересчитывает счетчики и признак популярности пользователей ids
+    несколькими групповыми запросами. Возвращает число исправленных
+    строк и id авторов, переставших быть популярными: ленты их
+    подписчиков нужно дозаполнить (timelines.backfill_many).
+    """
+    values = {
+        'posts_count': grouped_count(
+            Post.objects.filter(author__in=ids), 'author'),
+        'followers_count': grouped_count(
+            Follow.objects.filter(author__in=ids), 'author'),
+        'following_count': grouped_count(
+            Follow.objects.filter(user__in=ids), 'user'),
+    }
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    with transaction.atomic():
+        existing = {
+            counter.user_id: counter for counter in
+            UserCounter.objects.select_for_update().filter(user__in=ids)
+        }
+        to_create, to_update, unpopular = [], [], []
+        for user_id in ids:
+            counter = existing.get(user_id)
+            if counter is None:
+                counter = UserCounter(user_id=user_id)
+                to_create.append(counter)
+            changed = False
+            for field in USER_FIELDS:
+                value = values[field].get(user_id, 0)
+                if getattr(counter, field) != value:
+                    setattr(counter, field, value)
+                    changed = True
+            popular = counter.followers_count > limit
+            if counter.popular != popular:
+                if counter.pk and not popular:
+                    unpopular.append(user_id)
+                counter.popular = popular
+                changed = True
+            if changed and counter.pk:
+                to_update.append(counter)
+        UserCounter.objects.bulk_create(to_create)
+        UserCounter.objects.bulk_update(to_update,
+                                        USER_FIELDS + ('popular',))
+    return len(to_update), unpopular
+
+
+def bump_user(user_id, field, delta):
+    """
+    Изменяет счетчик пользователя на delta, не опуская его ниже нуля.
+    Строки нет - она создается пересчетом, который уже учитывает
+    изменение.
+    """
+    updated = UserCounter.objects.filter(
+        user=user_id, **{f'{field}__gte': -delta}
+    ).update(**{field: F(field) + delta})
+    if not updated and not UserCounter.objects.filter(
+            user=user_id).exists():
+        create_counters(user_id)
+
+
+def bump_comments(post_id, delta):
+    """Изменяет счетчик комментариев поста, не опуская его ниже нуля."""
+    Post.objects.filter(
+        pk=post_id, comments_count__gte=-delta
+    ).update(comments_count=F('comments_count') + delta)
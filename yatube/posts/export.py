@@ -0,0 +1,153 @@
+"""
+Потоковая выгрузка постов и комментариев пользователя.
+
+Строки читаются из базы порциями через .iterator(chunk_size=...)
+и сразу отдаются дальше, поэтому расход памяти не зависит от числа
+постов. Формат записей совпадает с тем, что принимает команда
+import_data. Архив zip с картинками тоже собирается на лету.
+"""
+import csv
+import io
+import json
+import zipfile
+
+from .models import Comment, Post
+
+
+EXPORT_CHUNK_SIZE = 2000
+FILE_CHUNK_SIZE = 64 * 1024
+
+POST_FIELDS = ('id', 'author', 'text', 'pub_date', 'group', 'image')
+COMMENT_FIELDS = ('post', 'author', 'text', 'created')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'zip': 'application/zip',
+}
+
+
+def post_records(author):
+    rows = (Post.objects
+            .filter(author=author)
+            .order_by('pk')
+            .values_list('id', 'text', 'pub_date', 'group__title', 'image')
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    for post_id, text, pub_date, group, image in rows:
+        yield {
+            'id': post_id,
+            'author': author.username,
+            'text': text,
+            'pub_date': pub_date.isoformat(),
+            'group': group or '',
+            'image': image,
+        }
+
+
+def comment_records(author):
+    rows = (Comment.objects
+            .filter(author=author)
+            .order_by('pk')
+            .values_list('post', 'text', 'created')
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    for post_id, text, created in rows:
+        yield {
+            'post': post_id,
+            'author': author.username,
+            'text': text,
+            'created': created.isoformat(),
+        }
+
+
+RECORDS = {
+    'posts': (POST_FIELDS, post_records),
+    'comments': (COMMENT_FIELDS, comment_records),
+}
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer, возвращающий строку."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(fields, records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def csv_lines(fields, records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for record in records:
+        yield writer.writerow([record[field] for field in fields])
+
+
+FORMATS = {
+    'ndjson': ndjson_lines,
+    'csv': csv_lines,
+}
+
+
+def export_lines(author, kind, file_format):
+    """Строки выгрузки kind ('posts' или 'comments') в формате file_format."""
+    fields, records = RECORDS[kind]
+    return FORMATS[file_format](fields, records(author))
+
+
+def export_bytes(author, kind, file_format):
+    for line in export_lines(author, kind, file_format):
+        yield line.encode()
+
+
+class StreamBuffer(io.RawIOBase):
+    """Несмещаемый поток, из которого забирают записанные zipfile байты."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        """Возвращает накопленные байты одним куском или ничего."""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return [data] if data else []
+
+
+def zip_stream(author):
+    """
+    Архив с posts.ndjson, comments.ndjson и картинками постов.
+    Каждый кусок архива отдается сразу после записи.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for kind in RECORDS:
+            with archive.open(f'{kind}.ndjson', 'w',
+                              force_zip64=True) as member:
+                for line in export_bytes(author, kind, 'ndjson'):
+                    member.write(line)
+                    yield from buffer.pop()
+        images = (Post.objects
+                  .filter(author=author)
+                  .exclude(image='')
+                  .order_by()
+                  .values_list('image', flat=True)
+                  .distinct()
+                  .iterator(chunk_size=EXPORT_CHUNK_SIZE))
+        storage = Post._meta.get_field('image').storage
+        for name in images:
+            if not storage.exists(name):
+                continue
+            with storage.open(name) as source, archive.open(
+                    f'images/{name}', 'w', force_zip64=True) as member:
+                for chunk in source.chunks(FILE_CHUNK_SIZE):
+                    member.write(chunk)
+                    yield from buffer.pop()
+    yield from buffer.pop()
@@ -0,0 +1,160 @@
+"""
+RSS и Atom ленты главной страницы, групп и профилей.
+
+Ответ проверяется условным GET: ETag строится по версии области кэша
+(меняется при любом изменении постов области), Last-Modified берется
+по дате самого нового поста. Дата ищется по индексу и только для
+запросов с одним If-Modified-Since: при If-None-Match он не
+проверяется (RFC 7232), и 304 по ETag отдается без запросов к базе.
+Сам текст ленты кэшируется через cache_feed до следующего bump()
+области.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+from django.views.decorators.http import condition
+
+from core.cache import cache_feed, versions_etag
+from .models import Group, Post
+
+
+User = get_user_model()
+
+FEED_ITEMS = 20
+
+
+def newest_pub_date(posts):
+    return (posts.order_by('-pub_date')
+            .values_list('pub_date', flat=True)
+            .first())
+
+
+class PostsFeed(Feed):
+    """Общая часть лент: оформление постов."""
+
+    def item_title(self, item):
+        return Truncator(item.text).words(10)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', args=(item.pk,))
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+
+class IndexFeed(PostsFeed):
+    title = 'Yatube: последние записи'
+    description = 'Новые записи всех пользователей'
+
+    def link(self):
+        return reverse('posts:index')
+
+    def items(self):
+        return Post.objects.feed()[:FEED_ITEMS]
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('posts:group_list', args=(group.slug,))
+
+    def items(self, group):
+        return group.posts.feed()[:FEED_ITEMS]
+
+
+class ProfileFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, author):
+        return f'Yatube: записи {author.get_full_name() or author.username}'
+
+    def description(self, author):
+        return f'Новые записи пользователя {author.username}'
+
+    def link(self, author):
+        return reverse('posts:profile', args=(author.username,))
+
+    def items(self, author):
+        return author.posts.feed()[:FEED_ITEMS]
+
+
+class IndexAtomFeed(IndexFeed):
+    feed_type = Atom1Feed
+    subtitle = IndexFeed.description
+
+
+class GroupAtomFeed(GroupFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, group):
+        return self.description(group)
+
+
+class ProfileAtomFeed(ProfileFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, author):
+        return self.description(author)
+
+
+def feed_view(feed_class, scope, latest):
+    """
+    Превращает ленту в view с кэшем cache_feed(scope) и условным GET.
+    latest(**kwargs) возвращает queryset постов ленты.
+    """
+    feed = feed_class()
+
+    def view(request, **kwargs):
+        return feed(request, **kwargs)
+    view.__name__ = feed_class.__name__
+
+    def etag(request, **kwargs):
+        return versions_etag(request, [scope.format(**kwargs)])
+
+    def last_modified(request, **kwargs):
+        if ('HTTP_IF_MODIFIED_SINCE' not in request.META
+                or 'HTTP_IF_NONE_MATCH' in request.META):
+            return None
+        return newest_pub_date(latest(**kwargs))
+
+    return condition(etag_func=etag, last_modified_func=last_modified)(
+        cache_feed(scope)(view))
+
+
+def index_posts():
+    return Post.objects.all()
+
+
+def group_posts(slug):
+    return Post.objects.filter(group__slug=slug)
+
+
+def profile_posts(username):
+    return Post.objects.filter(author__username=username)
+
+
+index_rss = feed_view(IndexFeed, 'index', index_posts)
+index_atom = feed_view(IndexAtomFeed, 'index', index_posts)
+group_rss = feed_view(GroupFeed, 'group:{slug}', group_posts)
+group_atom = feed_view(GroupAtomFeed, 'group:{slug}', group_posts)
+profile_rss = feed_view(ProfileFeed, 'profile:{username}', profile_posts)
+profile_atom = feed_view(ProfileAtomFeed, 'profile:{username}',
+                         profile_posts)
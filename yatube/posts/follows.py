@@ -0,0 +1,60 @@
+"""
+Граф подписок: множества id авторов, на которых подписан пользователь.
+
+Множество читается из базы одним запросом и хранится в кэше, поэтому
+проверка подписки на одного или сразу на всех авторов страницы не
+делает запросов. Сигналы Follow (см. posts.signals) сбрасывают
+множество подписчика при подписке и отписке.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+
+def followees_key(user_id):
+    return f'followees:{user_id}'
+
+
+def followees(user):
+    """Возвращает frozenset id авторов, на которых подписан user."""
+    if not user.is_authenticated:
+        return frozenset()
+    key = followees_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Follow.objects
+                        .filter(user=user)
+                        .values_list('author', flat=True))
+        cache.set(key, ids, settings.FOLLOWEES_TIMEOUT)
+    return ids
+
+
+def is_following(user, author):
+    return author.pk in followees(user)
+
+
+def is_following_many(user, author_ids):
+    """Словарь {id автора: подписан ли user} по одному чтению кэша."""
+    ids = followees(user)
+    return {author_id: author_id in ids for author_id in author_ids}
+
+
+def mark_following(user, posts):
+    """Выставляет post.author_followed постам страницы."""
+    posts = list(posts)
+    following = is_following_many(user, {post.author_id for post in posts})
+    for post in posts:
+        post.author_followed = following[post.author_id]
+    return posts
+
+
+def invalidate(user_id):
+    """
+    Сбрасывает множество подписок. Повторно после коммита: иначе
+    параллельный запрос мог бы успеть закэшировать старое множество.
+    """
+    key = followees_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,61 @@
+"""
+Кэш разметки поста, которая не зависит от зрителя: картинка и текст
+(posts/includes/post_body.html).
+
+Ключ фрагмента содержит id поста, время его изменения и хэш текста
+с именем картинки, поэтому после редактирования старый фрагмент
+просто перестает запрашиваться. Хэш нужен для правок через
+QuerySet.update() (админка, команды): auto_now их не замечает.
+Автор, дата, кнопка редактирования и ссылки, которые включаются
+флагами show_*, выводятся в posts/includes/post.html вне фрагмента.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core import timing
+from . import thumbnails
+
+
+FRAGMENT_TEMPLATE = 'posts/includes/post_body.html'
+
+
+def fragment_key(post):
+    content = hashlib.md5(
+        f'{post.image}:{post.text}'.encode()).hexdigest()
+    return (f'post_fragment:{post.pk}:{post.updated.timestamp()}:'
+            f'{content}')
+
+
+def attach_fragments(posts):
+    """
+    Кладет в post.fragment готовую разметку каждого поста.
+    Фрагменты читаются из кэша одним get_many, недостающие
+    рендерятся и записываются одним set_many.
+    """
+    posts = list(posts)
+    keys = {fragment_key(post): post for post in posts}
+    cached = cache.get_many(keys)
+    thumbnails.mark_ready([post for key, post in keys.items()
+                           if key not in cached])
+    missing = {}
+    for key, post in keys.items():
+        fragment = cached.get(key)
+        if fragment is None:
+            fragment = missing[key] = render_to_string(
+                FRAGMENT_TEMPLATE, {'post': post})
+        post.fragment = mark_safe(fragment)
+    timing.count_cache('fragment', 'hit', len(cached))
+    timing.count_cache('fragment', 'miss', len(missing))
+    if missing:
+        cache.set_many(missing, settings.POST_FRAGMENT_TIMEOUT)
+    return posts
+
+
+def with_fragments(page_obj):
+    """Подставляет фрагменты в посты страницы пагинатора."""
+    page_obj.object_list = attach_fragments(page_obj.object_list)
+    return page_obj
@@ -0,0 +1,180 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+
+SCHEMA = (
+    'CREATE TABLE posts_post ('
+    ' id integer PRIMARY KEY AUTOINCREMENT, text text NOT NULL,'
+    ' pub_date datetime NOT NULL, author_id integer NOT NULL,'
+    ' group_id integer NULL, image varchar(100) NOT NULL)',
+    'CREATE TABLE posts_comment ('
+    ' id integer PRIMARY KEY AUTOINCREMENT, text text NOT NULL,'
+    ' created datetime NOT NULL, author_id integer NOT NULL,'
+    ' post_id integer NOT NULL)',
+    'CREATE TABLE posts_follow ('
+    ' id integer PRIMARY KEY AUTOINCREMENT,'
+    ' author_id integer NOT NULL, user_id integer NOT NULL)',
+    # Индексы, которые Django создает для внешних ключей
+    'CREATE INDEX posts_post_author_id ON posts_post (author_id)',
+    'CREATE INDEX posts_post_group_id ON posts_post (group_id)',
+    'CREATE INDEX posts_comment_post_id ON posts_comment (post_id)',
+    'CREATE INDEX posts_comment_author_id ON posts_comment (author_id)',
+    'CREATE INDEX posts_follow_author_id ON posts_follow (author_id)',
+    'CREATE INDEX posts_follow_user_id ON posts_follow (user_id)',
+)
+
+# Те же индексы, что создает миграция 0007_feed_indexes
+FEED_INDEXES = (
+    'CREATE INDEX post_pub_date_idx ON posts_post (pub_date DESC, id DESC)',
+    'CREATE INDEX post_author_pub_date_idx'
+    ' ON posts_post (author_id, pub_date DESC)',
+    'CREATE INDEX post_group_pub_date_idx'
+    ' ON posts_post (group_id, pub_date DESC)',
+    'CREATE INDEX comment_post_created_idx'
+    ' ON posts_comment (post_id, created)',
+    'CREATE UNIQUE INDEX unique_follow ON posts_follow (user_id, author_id)',
+)
+
+FEED_INDEX_NAMES = (
+    'post_pub_date_idx', 'post_author_pub_date_idx',
+    'post_group_pub_date_idx', 'comment_post_created_idx', 'unique_follow',
+)
+
+START = datetime(2015, 1, 1)
+
+POST_COLUMNS = 'id, text, pub_date, author_id, group_id, image'
+
+QUERIES = (
+    ('index', 'SELECT ' + POST_COLUMNS + ' FROM posts_post'
+     ' ORDER BY pub_date DESC, id DESC LIMIT 10 OFFSET :offset'),
+    ('group_list', 'SELECT ' + POST_COLUMNS + ' FROM posts_post'
+     ' WHERE group_id = :group ORDER BY pub_date DESC LIMIT 10'),
+    ('profile', 'SELECT ' + POST_COLUMNS + ' FROM posts_post'
+     ' WHERE author_id = :user ORDER BY pub_date DESC LIMIT 10'),
+    ('follow_index', 'SELECT ' + POST_COLUMNS + ' FROM posts_post'
+     ' WHERE author_id IN (SELECT author_id FROM posts_follow'
+     ' WHERE user_id = :user) ORDER BY pub_date DESC LIMIT 10'),
+    ('comments', 'SELECT id, text, created, author_id FROM posts_comment'
+     ' WHERE post_id = :post ORDER BY created'),
+    ('check_subscribed', 'SELECT id FROM posts_follow'
+     ' WHERE user_id = :user AND author_id = :author'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает планы и время запросов лент до и после '
+            'составных индексов на сгенерированной базе SQLite')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path',
+                            help='Файл базы; по умолчанию временный')
+        parser.add_argument('--users', type=int, default=50000)
+        parser.add_argument('--groups', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=2000000)
+        parser.add_argument('--comments', type=int, default=2000000)
+        parser.add_argument('--follows', type=int, default=500000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        temporary = path is None
+        if temporary:
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            os.remove(path)
+        connection = sqlite3.connect(path)
+        try:
+            self.seed(connection, options)
+            for name in FEED_INDEX_NAMES:
+                connection.execute(f'DROP INDEX IF EXISTS {name}')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                'До миграции (только индексы внешних ключей)'))
+            before = self.measure(connection, options)
+            for statement in FEED_INDEXES:
+                connection.execute(statement)
+            connection.execute('ANALYZE')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                'После миграции 0007_feed_indexes'))
+            after = self.measure(connection, options)
+        finally:
+            connection.close()
+            if temporary:
+                os.remove(path)
+        self.stdout.write(self.style.MIGRATE_HEADING('Итог, мс на запрос'))
+        for name, _ in QUERIES:
+            self.stdout.write(
+                f'{name:<18} {before[name]:>10.3f} -> {after[name]:>10.3f}')
+
+    def seed(self, connection, options):
+        if connection.execute(
+                "SELECT count(*) FROM sqlite_master WHERE name='posts_post'"
+        ).fetchone()[0]:
+            self.stdout.write('Используется существующая база')
+            return
+        rnd = random.Random(options['seed'])
+        users, groups = options['users'], options['groups']
+        for statement in SCHEMA:
+            connection.execute(statement)
+        started = time.perf_counter()
+        connection.executemany(
+            'INSERT INTO posts_post (text, pub_date, author_id, group_id,'
+            ' image) VALUES (?, ?, ?, ?, ?)',
+            ((f'Пост {number}', self.timestamp(number),
+              rnd.randint(1, users),
+              rnd.randint(1, groups) if rnd.random() < 0.7 else None, '')
+             for number in range(options['posts'])))
+        connection.executemany(
+            'INSERT INTO posts_comment (text, created, author_id, post_id)'
+            ' VALUES (?, ?, ?, ?)',
+            ((f'Комментарий {number}', self.timestamp(number),
+              rnd.randint(1, users), rnd.randint(1, options['posts']))
+             for number in range(options['comments'])))
+        pairs = set()
+        while len(pairs) < min(options['follows'], users * (users - 1)):
+            pairs.add((rnd.randint(1, users), rnd.randint(1, users)))
+        connection.executemany(
+            'INSERT INTO posts_follow (user_id, author_id) VALUES (?, ?)',
+            sorted(pairs))
+        connection.commit()
+        connection.execute('ANALYZE')
+        self.stdout.write(
+            f'База заполнена за {time.perf_counter() - started:.1f} с')
+
+    def measure(self, connection, options):
+        rnd = random.Random(options['seed'])
+        results = {}
+        for name, sql in QUERIES:
+            params = self.params(rnd, options)
+            plan = connection.execute(
+                'EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+            self.stdout.write(self.style.SQL_KEYWORD(name))
+            for row in plan:
+                self.stdout.write(f'    {row[-1]}')
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                connection.execute(sql, self.params(rnd, options)).fetchall()
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            results[name] = elapsed * 1000
+            self.stdout.write(f'    {results[name]:.3f} мс')
+        return results
+
+    @staticmethod
+    def params(rnd, options):
+        return {
+            'offset': rnd.randint(0, 1000) * 10,
+            'group': rnd.randint(1, options['groups']),
+            'user': rnd.randint(1, options['users']),
+            'author': rnd.randint(1, options['users']),
+            'post': rnd.randint(1, options['posts']),
+        }
+
+    @staticmethod
+    def timestamp(number):
+        return str(START + timedelta(seconds=number))
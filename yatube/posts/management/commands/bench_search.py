@@ -0,0 +1,151 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+
+SCHEMA = (
+    'CREATE TABLE posts_group ('
+    ' id integer PRIMARY KEY AUTOINCREMENT, title varchar(200) NOT NULL,'
+    ' description text NOT NULL)',
+    'CREATE TABLE posts_post ('
+    ' id integer PRIMARY KEY AUTOINCREMENT, text text NOT NULL,'
+    ' pub_date datetime NOT NULL, group_id integer NULL)',
+    'CREATE INDEX posts_post_group_id ON posts_post (group_id)',
+    'CREATE INDEX post_pub_date_idx ON posts_post (pub_date DESC, id DESC)',
+)
+
+# Та же таблица, что создает миграция 0011_post_search
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE posts_search USING fts5("
+    " text, group_title, group_description, tokenize='trigram')",
+    "INSERT INTO posts_search (rowid, text, group_title, group_description)"
+    " SELECT p.id, p.text, g.title, g.description FROM posts_post p"
+    " LEFT JOIN posts_group g ON g.id = p.group_id",
+)
+
+WORDS = (
+    'кот', 'кошка', 'собака', 'город', 'река', 'солнце', 'дождь', 'утро',
+    'вечер', 'работа', 'отпуск', 'море', 'книга', 'фильм', 'музыка',
+    'дорога', 'поезд', 'самолет', 'друг', 'семья', 'праздник', 'зима',
+    'весна', 'лето', 'осень', 'парк', 'лес', 'гора', 'озеро', 'сад',
+    'идти', 'читать', 'смотреть', 'любить', 'думать', 'писать', 'видеть',
+    'новый', 'старый', 'красивый', 'быстрый', 'тихий', 'далекий',
+)
+
+# Встречается примерно в одном посте из десяти тысяч
+RARE_WORD = 'редкость'
+RARE_PROBABILITY = 0.0001
+
+LIKE_SQL = (
+    'SELECT p.id FROM posts_post p LEFT JOIN posts_group g'
+    ' ON g.id = p.group_id WHERE p.text LIKE :like'
+    ' OR g.title LIKE :like OR g.description LIKE :like'
+    ' ORDER BY p.pub_date DESC LIMIT 10'
+)
+MATCH_SQL = (
+    'SELECT id FROM posts_post WHERE id IN (SELECT rowid FROM posts_search'
+    ' WHERE posts_search MATCH :match) ORDER BY pub_date DESC LIMIT 10'
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск через FTS5 (триграммы) с LIKE %...% '
+            '(icontains) на сгенерированной базе SQLite')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path',
+                            help='Файл базы; по умолчанию временный')
+        parser.add_argument('--groups', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=2000000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        temporary = path is None
+        if temporary:
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            os.remove(path)
+        connection = sqlite3.connect(path)
+        try:
+            self.seed(connection, options)
+            queries = self.queries(options)
+            self.stdout.write(self.style.MIGRATE_HEADING('LIKE %...%'))
+            like = self.measure(connection, LIKE_SQL, queries, options)
+            self.stdout.write(self.style.MIGRATE_HEADING('FTS5 MATCH'))
+            match = self.measure(connection, MATCH_SQL, queries, options)
+        finally:
+            connection.close()
+            if temporary:
+                os.remove(path)
+        self.stdout.write(self.style.MIGRATE_HEADING('Итог, мс на запрос'))
+        for query in queries:
+            self.stdout.write(f'{query:<20} {like[query]:>10.3f} -> '
+                              f'{match[query]:>10.3f}')
+
+    def seed(self, connection, options):
+        if connection.execute(
+                "SELECT count(*) FROM sqlite_master WHERE name='posts_post'"
+        ).fetchone()[0]:
+            self.stdout.write('Используется существующая база')
+            return
+        rnd = random.Random(options['seed'])
+        for statement in SCHEMA:
+            connection.execute(statement)
+        started = time.perf_counter()
+        connection.executemany(
+            'INSERT INTO posts_group (title, description) VALUES (?, ?)',
+            ((self.sentence(rnd, 2), self.sentence(rnd, 8))
+             for _ in range(options['groups'])))
+        connection.executemany(
+            'INSERT INTO posts_post (text, pub_date, group_id)'
+            ' VALUES (?, ?, ?)',
+            ((self.post_text(rnd), number,
+              rnd.randint(1, options['groups'])
+              if rnd.random() < 0.7 else None)
+             for number in range(options['posts'])))
+        connection.commit()
+        self.stdout.write(
+            f'База заполнена за {time.perf_counter() - started:.1f} с')
+        started = time.perf_counter()
+        for statement in FTS_SCHEMA:
+            connection.execute(statement)
+        connection.commit()
+        self.stdout.write(
+            f'Индекс FTS5 построен за {time.perf_counter() - started:.1f} с')
+
+    def queries(self, options):
+        rnd = random.Random(options['seed'])
+        words = rnd.sample(WORDS, 2)
+        # Частое слово, основа слова, редкое слово и слово, которого нет.
+        # LIKE, идя по индексу даты, быстро набирает десять постов с
+        # частым словом, но ради редкого просматривает всю таблицу
+        return [words[0], words[1][:4], RARE_WORD, 'несуществующее']
+
+    def measure(self, connection, sql, queries, options):
+        results = {}
+        for query in queries:
+            params = {'like': f'%{query}%', 'match': f'"{query}"'}
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                rows = connection.execute(sql, params).fetchall()
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            results[query] = elapsed * 1000
+            self.stdout.write(f'{query:<20} {results[query]:>10.3f} мс, '
+                              f'найдено {len(rows)}')
+        return results
+
+    def post_text(self, rnd):
+        text = self.sentence(rnd, rnd.randint(5, 40))
+        if rnd.random() < RARE_PROBABILITY:
+            text += ' ' + RARE_WORD
+        return text
+
+    @staticmethod
+    def sentence(rnd, length):
+        return ' '.join(rnd.choice(WORDS) for _ in range(length))
@@ -0,0 +1,44 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты или комментарии пользователя в NDJSON или CSV, '
+            'либо все вместе с картинками в zip')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--kind', choices=tuple(export.RECORDS),
+                            default='posts')
+        parser.add_argument('--format',
+                            choices=tuple(export.FORMATS) + ('zip',),
+                            default='ndjson')
+        parser.add_argument('--output',
+                            help='Файл; по умолчанию стандартный вывод')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден')
+        if options['format'] == 'zip':
+            chunks = export.zip_stream(author)
+        else:
+            chunks = export.export_bytes(author, options['kind'],
+                                         options['format'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
@@ -0,0 +1,279 @@
+import random
+import time
+from array import array
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+
+from posts import timelines
+from posts.search import bulk_indexing
+from posts.models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+# Размер словаря и набора имен, из которых собираются тексты
+VOCABULARY_SIZE = 5000
+NAMES_SIZE = 1000
+# Доля постов в группах и наибольшая задержка комментария после поста
+GROUP_PROBABILITY = 0.7
+COMMENT_DELAY = timedelta(days=7)
+
+
+def power_law_weights(count, alpha):
+    """
+    Накопленные веса закона Ципфа: i-й элемент выбирается
+    с вероятностью, пропорциональной 1 / i ** alpha.
+    """
+    return array('d', accumulate(1 / rank ** alpha
+                                 for rank in range(1, count + 1)))
+
+
+def power_law_choice(rnd, cum_weights):
+    """Индекс элемента по накопленным весам."""
+    return bisect(cum_weights, rnd.random() * cum_weights[-1])
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками для нагрузочных '
+            'замеров. Число постов у авторов и подписчиков распределено '
+            'по степенному закону; при одном --seed данные совпадают')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=100000)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Показатель степенного закона')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределены посты')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс имен пользователей и групп')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Строк в одном INSERT')
+
+    def handle(self, *args, **options):
+        self.prefix = options['prefix']
+        if (User.objects.filter(username__startswith=f'{self.prefix}_')
+                .exists()
+                or Group.objects.filter(slug__startswith=f'{self.prefix}-')
+                .exists()):
+            raise CommandError(
+                f'Данные с префиксом {self.prefix} уже есть, '
+                f'укажите другой --prefix')
+        self.rnd = random.Random(options['seed'])
+        faker = Faker('ru_RU')
+        faker.seed_instance(options['seed'])
+        self.words = faker.words(VOCABULARY_SIZE)
+        self.first_names = [faker.first_name() for _ in range(NAMES_SIZE)]
+        self.last_names = [faker.last_name() for _ in range(NAMES_SIZE)]
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        users = self.step('Пользователи', self.create_users, options)
+        groups = self.step('Группы', self.create_groups, options)
+        posts = self.step('Посты', self.create_posts, options,
+                          users, groups)
+        self.step('Комментарии', self.create_comments, options,
+                  users, posts)
+        self.step('Подписки', self.create_follows, options, users)
+        self.step('Счетчики', lambda options: call_command(
+            'recount_counters', batch_size=self.batch_size,
+            stdout=self.stdout), options)
+        self.step('Ленты подписок', self.fill_timelines, options)
+        # Версии областей и кэш страниц не знают о новых строках
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def step(self, title, function, options, *args):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        started = time.perf_counter()
+        result = function(options, *args)
+        self.stdout.write(f'{time.perf_counter() - started:.1f} с')
+        return result
+
+    def insert(self, model, fields, rows, ignore_conflicts=False):
+        """
+        Вставляет кортежи rows в таблицу model через executemany,
+        минуя создание моделей. Даты приводятся к формату базы.
+        """
+        ops = connection.ops
+        columns = [model._meta.get_field(field).column for field in fields]
+        converters = [
+            ops.adapt_datetimefield_value
+            if model._meta.get_field(field).get_internal_type()
+            == 'DateTimeField' else None
+            for field in fields
+        ]
+        sql = '{} {} ({}) VALUES ({}) {}'.format(
+            ops.insert_statement(ignore_conflicts=ignore_conflicts),
+            ops.quote_name(model._meta.db_table),
+            ', '.join(ops.quote_name(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts),
+        ).rstrip()
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append([value if convert is None else convert(value)
+                          for convert, value in zip(converters, row)])
+            if len(batch) >= self.batch_size:
+                total += self.insert_batch(sql, batch)
+                batch = []
+        if batch:
+            total += self.insert_batch(sql, batch)
+        return total
+
+    def insert_batch(self, sql, batch):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+        return len(batch)
+
+    def ids(self, queryset):
+        """id строк в порядке вставки, компактным массивом."""
+        return array('q', queryset.order_by('pk')
+                     .values_list('pk', flat=True)
+                     .iterator(chunk_size=self.batch_size))
+
+    def sentence(self, length):
+        return ' '.join(self.rnd.choice(self.words) for _ in range(length))
+
+    def create_users(self, options):
+        password = make_password(None)
+        rows = ((password, False, f'{self.prefix}_{number}',
+                 self.rnd.choice(self.first_names),
+                 self.rnd.choice(self.last_names),
+                 f'{self.prefix}_{number}@example.com',
+                 False, True, self.now)
+                for number in range(options['users']))
+        self.insert(User, ('password', 'is_superuser', 'username',
+                           'first_name', 'last_name', 'email', 'is_staff',
+                           'is_active', 'date_joined'), rows)
+        users = self.ids(User.objects.filter(
+            username__startswith=f'{self.prefix}_'))
+        self.first_user = min(users, default=0)
+        # Популярность автора не связана с порядком id
+        self.rnd.shuffle(users)
+        self.stdout.write(f'Пользователей: {len(users)}')
+        return users
+
+    def create_groups(self, options):
+        rows = ((f'{self.sentence(2).capitalize()} {number}',
+                 f'{self.prefix}-{number}', self.sentence(12))
+                for number in range(options['groups']))
+        self.insert(Group, ('title', 'slug', 'description'), rows)
+        groups = self.ids(Group.objects.filter(
+            slug__startswith=f'{self.prefix}-'))
+        self.stdout.write(f'Групп: {len(groups)}')
+        return groups
+
+    def create_posts(self, options, users, groups):
+        """
+        Авторы и группы постов выбираются по степенному закону.
+        Даты идут по возрастанию вместе с id, как у настоящих постов.
+        """
+        if not users:
+            return array('q')
+        authors = power_law_weights(len(users), options['alpha'])
+        group_weights = (power_law_weights(len(groups), options['alpha'])
+                         if groups else None)
+        start, step = self.post_dates(options)
+
+        def rows():
+            for number in range(options['posts']):
+                pub_date = start + (number + self.rnd.random()) * step
+                group = None
+                if group_weights and self.rnd.random() < GROUP_PROBABILITY:
+                    group = groups[power_law_choice(self.rnd, group_weights)]
+                yield (self.sentence(self.rnd.randint(5, 60)), pub_date,
+                       pub_date,
+                       users[power_law_choice(self.rnd, authors)],
+                       group, '', 0)
+
+        first_id = (Post.objects.order_by('-pk')
+                    .values_list('pk', flat=True).first() or 0)
+        with bulk_indexing():
+            self.insert(Post, ('text', 'pub_date', 'updated', 'author',
+                               'group', 'image', 'comments_count'), rows())
+        posts = self.ids(Post.objects.filter(pk__gt=first_id))
+        self.stdout.write(f'Постов: {len(posts)}')
+        return posts
+
+    def post_dates(self, options):
+        """Начало интервала дат постов и шаг между соседними постами."""
+        period = timedelta(days=options['days'])
+        return self.now - period, period / max(options['posts'], 1)
+
+    def create_comments(self, options, users, posts):
+        """
+        Популярные посты получают больше комментариев. Комментарий
+        пишется не раньше поста и не позже чем через COMMENT_DELAY.
+        """
+        if not posts or not users:
+            return
+        weights = power_law_weights(len(posts), options['alpha'])
+        # Популярность поста не зависит от его возраста
+        order = array('q', range(len(posts)))
+        self.rnd.shuffle(order)
+        start, step = self.post_dates(options)
+
+        def rows():
+            for _ in range(options['comments']):
+                index = order[power_law_choice(self.rnd, weights)]
+                created = (start + (index + 1) * step
+                           + self.rnd.random() * COMMENT_DELAY)
+                yield (posts[index], self.rnd.choice(users),
+                       self.sentence(self.rnd.randint(3, 20)),
+                       min(created, self.now))
+
+        count = self.insert(Comment, ('post', 'author', 'text', 'created'),
+                            rows())
+        self.stdout.write(f'Комментариев: {count}')
+
+    def create_follows(self, options, users):
+        """
+        Подписчик выбирается равномерно, автор - по степенному закону,
+        поэтому у немногих авторов оказывается большинство подписчиков.
+        Повторные пары пропускаются базой.
+        """
+        if len(users) < 2:
+            return
+        authors = power_law_weights(len(users), options['alpha'])
+
+        def rows():
+            for _ in range(options['follows']):
+                user = self.rnd.choice(users)
+                author = users[power_law_choice(self.rnd, authors)]
+                if user != author:
+                    yield user, author
+
+        self.insert(Follow, ('user', 'author'), rows(),
+                    ignore_conflicts=True)
+        count = Follow.objects.filter(
+            user__username__startswith=f'{self.prefix}_').count()
+        self.stdout.write(f'Подписок: {count}')
+
+    def fill_timelines(self, options):
+        """
+        Заполняет ленты подписок так, как это сделал бы
+        timelines.backfill при подписке.
+        """
+        # Новые пользователи подписаны только друг на друга, а их id
+        # больше id всех прежних пользователей
+        with transaction.atomic():
+            count = timelines.backfill_many(
+                Follow.objects.filter(user__gte=self.first_user))
+        self.stdout.write(f'Записей лент: {count}')
@@ -0,0 +1,312 @@
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.cache import bump
+from posts import counters, timelines
+from posts.models import Comment, Follow, Group, ImportedPost, Post
+
+
+User = get_user_model()
+
+KINDS = ('posts', 'comments', 'follows')
+
+
+def chunked(iterable, size):
+    """Выдает элементы списками по size штук, не читая все сразу."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def source_id(record, field='id'):
+    """id записи на старой платформе строкой или None."""
+    value = record.get(field)
+    if value is None or value == '':
+        return None
+    return str(value)
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise CommandError(f'Неверная дата: {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return date
+
+
+@contextmanager
+def explicit_dates():
+    """
+    Отключает auto_now_add у дат постов и комментариев, чтобы
+    сохранить даты со старой платформы.
+    """
+    fields = (Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created'))
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Импортирует посты, комментарии или подписки из NDJSON '
+            'или CSV потоково, пачками bulk_create, с продолжением '
+            'с контрольной точки. Посты получают новые id, старые '
+            'запоминаются в ImportedPost: по ним комментарии находят '
+            'свои посты, а повторный импорт пропускает уже загруженные')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--kind', choices=KINDS, required=True,
+                            help='Что содержит файл')
+        parser.add_argument('--format', choices=('ndjson', 'csv'),
+                            help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Записей в одном INSERT')
+        parser.add_argument('--transaction-size', type=int, default=20000,
+                            help='Записей в одной транзакции')
+        parser.add_argument('--checkpoint',
+                            help='Файл контрольной точки; по умолчанию '
+                                 '<path>.checkpoint')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать сначала, игнорируя контрольную '
+                                 'точку')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'ndjson')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        self.batch_size = options['batch_size']
+        self.users = {}
+        self.groups = {}
+        self.scopes = set()
+        self.skipped = 0
+        import_batch = getattr(self, f'import_{options["kind"]}')
+
+        done = 0 if options['restart'] else self.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Продолжение с записи {done}')
+        records = islice(self.read_records(path, file_format), done, None)
+        imported = 0
+        started = time.perf_counter()
+        with explicit_dates():
+            for chunk in chunked(records, options['transaction_size']):
+                with transaction.atomic():
+                    for batch in chunked(chunk, self.batch_size):
+                        import_batch(batch)
+                done += len(chunk)
+                imported += len(chunk)
+                self.write_checkpoint(checkpoint, done)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'Записей: {done}, {imported / elapsed:.0f} в секунду')
+
+        if self.skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено записей без своего поста: {self.skipped}'))
+        bump('index', *self.scopes)
+        call_command('recount_counters', stdout=self.stdout)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано записей: {imported}'))
+
+    def read_records(self, path, file_format):
+        with open(path, encoding='utf-8', newline='') as file:
+            if file_format == 'csv':
+                yield from csv.DictReader(file)
+                return
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+    @staticmethod
+    def read_checkpoint(checkpoint):
+        try:
+            with open(checkpoint) as file:
+                return int(file.read())
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def write_checkpoint(checkpoint, done):
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w') as file:
+            file.write(str(done))
+        os.replace(temporary, checkpoint)
+
+    def bulk_create(self, model, objs, **kwargs):
+        """
+        bulk_create пачками не больше batch_size и не больше, чем
+        позволяет база: Django 2.2 не урезает явный batch_size
+        до ограничений SQLite на число параметров и строк в INSERT.
+        """
+        limit = connection.ops.bulk_batch_size(
+            model._meta.concrete_fields, objs)
+        model.objects.bulk_create(
+            objs, batch_size=min(self.batch_size, limit), **kwargs)
+
+    @staticmethod
+    def created_ids(model, objs):
+        """
+        id строк, только что вставленных bulk_create, в порядке objs.
+        PostgreSQL возвращает их из INSERT сам. SQLite пишет одним
+        писателем, и до конца транзакции база заблокирована для других,
+        поэтому последние len(objs) строк таблицы - наши.
+        """
+        if connection.features.can_return_ids_from_bulk_insert:
+            return [obj.pk for obj in objs]
+        return sorted(model.objects.order_by('-pk')
+                      .values_list('pk', flat=True)[:len(objs)])
+
+    @staticmethod
+    def last_id(model):
+        return (model.objects.order_by('-pk')
+                .values_list('pk', flat=True).first() or 0)
+
+    def resolve_users(self, usernames):
+        """
+        Возвращает id пользователей по username, создавая
+        отсутствующих без пароля. Найденные id запоминаются.
+        """
+        missing = set(usernames) - self.users.keys()
+        if missing:
+            self.users.update(User.objects
+                              .filter(username__in=missing)
+                              .values_list('username', 'id'))
+            self.bulk_create(
+                User,
+                [User(username=username, password=make_password(None))
+                 for username in missing - self.users.keys()])
+            self.users.update(User.objects
+                              .filter(username__in=missing)
+                              .values_list('username', 'id'))
+        return self.users
+
+    def resolve_group(self, record):
+        """Находит группу по названию или создает ее через Group.save."""
+        title = record.get('group')
+        if not title:
+            return None
+        if title not in self.groups:
+            group = Group.objects.filter(title=title).first()
+            if group is None:
+                group = Group(title=title,
+                              description=record.get('group_description')
+                              or '')
+                group.save()
+            self.groups[title] = group
+        return self.groups[title]
+
+    def import_posts(self, batch):
+        """
+        Id постов назначает база: id старой платформы могут совпасть
+        с постами, которые уже есть. Посты, чей id уже импортирован,
+        пропускаются.
+        """
+        imported = set(ImportedPost.objects
+                       .filter(source_id__in=[source_id(record)
+                                              for record in batch])
+                       .values_list('source_id', flat=True))
+        records = []
+        for record in batch:
+            source = source_id(record)
+            if source is not None:
+                if source in imported:
+                    continue
+                imported.add(source)
+            records.append(record)
+        if not records:
+            return
+        users = self.resolve_users(record['author'] for record in records)
+        posts = []
+        for record in records:
+            group = self.resolve_group(record)
+            posts.append(Post(
+                text=record['text'],
+                author_id=users[record['author']],
+                group=group,
+                pub_date=parse_date(record.get('pub_date')),
+                image=record.get('image') or '',
+            ))
+            self.scopes.add(f'profile:{record["author"]}')
+            if group:
+                self.scopes.add(f'group:{group.slug}')
+        self.bulk_create(Post, posts)
+        for post, pk in zip(posts, self.created_ids(Post, posts)):
+            post.pk = pk
+        self.bulk_create(ImportedPost, [
+            ImportedPost(source_id=source_id(record), post_id=post.pk)
+            for record, post in zip(records, posts)
+            if source_id(record) is not None
+        ])
+        timelines.fan_out_many(posts)
+
+    def import_comments(self, batch):
+        """Комментарий к посту, который не импортирован, пропускается."""
+        posts = dict(ImportedPost.objects
+                     .filter(source_id__in=[source_id(record, 'post')
+                                            for record in batch])
+                     .values_list('source_id', 'post'))
+        records = [record for record in batch
+                   if source_id(record, 'post') in posts]
+        self.skipped += len(batch) - len(records)
+        users = self.resolve_users(record['author'] for record in records)
+        self.bulk_create(
+            Comment,
+            [Comment(post_id=posts[source_id(record, 'post')],
+                     author_id=users[record['author']],
+                     text=record['text'],
+                     created=parse_date(record.get('created')))
+             for record in records])
+
+    def import_follows(self, batch):
+        """
+        Подписка видна в ленте сразу: после вставки подписок счетчики
+        их участников пересчитываются (сигналы bulk_create не вызывает),
+        и ленты заполняются одним INSERT ... SELECT.
+        """
+        users = self.resolve_users(
+            username for record in batch
+            for username in (record['user'], record['author']))
+        batch = [record for record in batch
+                 if record['user'] != record['author']]
+        last_id = self.last_id(Follow)
+        self.bulk_create(
+            Follow,
+            [Follow(user_id=users[record['user']],
+                    author_id=users[record['author']])
+             for record in batch],
+            ignore_conflicts=True)
+        _, unpopular = counters.recount_users(sorted(
+            {users[record[field]] for record in batch
+             for field in ('user', 'author')}))
+        timelines.backfill_many(Follow.objects.filter(pk__gt=last_id))
+        if unpopular:
+            timelines.backfill_many(
+                Follow.objects.filter(author__in=unpopular))
+        for record in batch:
+            self.scopes.add(f'profile:{record["user"]}')
+            self.scopes.add(f'profile:{record["author"]}')
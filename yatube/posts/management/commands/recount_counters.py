@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters, timelines
+from posts.counters import grouped_count
+from posts.models import Comment, Follow, Post
+
+
+User = get_user_model()
+
+
+def id_batches(queryset, batch_size):
+    """Выдает id объектов пачками по возрастанию, без OFFSET."""
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_id)
+                   .order_by('pk')
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счетчики постов, '
+            'комментариев и подписок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed = self.recount_users(batch_size)
+        self.stdout.write(f'Счетчиков пользователей исправлено: {fixed}')
+        fixed = self.recount_posts(batch_size)
+        self.stdout.write(f'Счетчиков комментариев исправлено: {fixed}')
+
+    def recount_users(self, batch_size):
+        """
+        Ленты подписчиков авторов, переставших быть популярными,
+        дозаполняются, как в timelines.update_popularity.
+        """
+        fixed = 0
+        for ids in id_batches(User.objects.all(), batch_size):
+            with transaction.atomic():
+                batch_fixed, unpopular = counters.recount_users(ids)
+                if unpopular:
+                    timelines.backfill_many(
+                        Follow.objects.filter(author__in=unpopular))
+            fixed += batch_fixed
+        return fixed
+
+    def recount_posts(self, batch_size):
+        fixed = 0
+        for ids in id_batches(Post.objects.all(), batch_size):
+            comments = grouped_count(
+                Comment.objects.filter(post__in=ids), 'post')
+            with transaction.atomic():
+                to_update = []
+                for post in (Post.objects.select_for_update()
+                             .filter(pk__in=ids).only('comments_count')):
+                    value = comments.get(post.pk, 0)
+                    if post.comments_count != value:
+                        post.comments_count = value
+                        to_update.append(post)
+                Post.objects.bulk_update(to_update, ('comments_count',))
+            fixed += len(to_update)
+        return fixed
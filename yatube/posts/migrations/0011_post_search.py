@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:40
+
+import sqlite3
+
+from django.db import migrations
+
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE posts_search USING fts5("
+    " text, group_title, group_description, tokenize='trigram')",
+    # rowid записи поиска равен id поста
+    "INSERT INTO posts_search (rowid, text, group_title, group_description)"
+    " SELECT p.id, p.text, g.title, g.description FROM posts_post p"
+    " LEFT JOIN posts_group g ON g.id = p.group_id",
+    "CREATE TRIGGER posts_search_insert AFTER INSERT ON posts_post BEGIN"
+    " INSERT INTO posts_search"
+    " (rowid, text, group_title, group_description)"
+    " SELECT new.id, new.text, g.title, g.description FROM (SELECT 1)"
+    " LEFT JOIN posts_group g ON g.id = new.group_id; END",
+    "CREATE TRIGGER posts_search_update AFTER UPDATE OF text, group_id"
+    " ON posts_post BEGIN"
+    " DELETE FROM posts_search WHERE rowid = old.id;"
+    " INSERT INTO posts_search"
+    " (rowid, text, group_title, group_description)"
+    " SELECT new.id, new.text, g.title, g.description FROM (SELECT 1)"
+    " LEFT JOIN posts_group g ON g.id = new.group_id; END",
+    "CREATE TRIGGER posts_search_delete AFTER DELETE ON posts_post BEGIN"
+    " DELETE FROM posts_search WHERE rowid = old.id; END",
+    "CREATE TRIGGER posts_search_group_update"
+    " AFTER UPDATE OF title, description ON posts_group BEGIN"
+    " UPDATE posts_search"
+    " SET group_title = new.title, group_description = new.description"
+    " WHERE rowid IN (SELECT id FROM posts_post WHERE group_id = new.id);"
+    " END",
+)
+
+DROP_SQL = (
+    'DROP TRIGGER IF EXISTS posts_search_group_update',
+    'DROP TRIGGER IF EXISTS posts_search_delete',
+    'DROP TRIGGER IF EXISTS posts_search_update',
+    'DROP TRIGGER IF EXISTS posts_search_insert',
+    'DROP TABLE IF EXISTS posts_search',
+)
+
+
+def fts_available(schema_editor):
+    # Триграммный токенизатор FTS5 есть в SQLite начиная с 3.34
+    return (schema_editor.connection.vendor == 'sqlite'
+            and sqlite3.sqlite_version_info >= (3, 34, 0))
+
+
+def create_search(apps, schema_editor):
+    if not fts_available(schema_editor):
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search(apps, schema_editor):
+    if not fts_available(schema_editor):
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_hashed_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
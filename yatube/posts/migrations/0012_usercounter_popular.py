@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_popular(apps, schema_editor):
+    """Отмечает авторов, которых лента уже считала популярными."""
+    UserCounter = apps.get_model('posts', 'UserCounter')
+    UserCounter.objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).update(popular=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounter',
+            name='popular',
+            field=models.BooleanField(default=False, help_text='Посты не раскладываются по лентам подписчиков', verbose_name='Популярный автор'),
+        ),
+        migrations.RunPython(mark_popular, migrations.RunPython.noop),
+    ]
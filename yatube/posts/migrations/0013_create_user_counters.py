@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+BATCH_SIZE = 1000
+
+
+def count(model, field):
+    return Coalesce(Subquery(
+        model.objects
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('id'))
+        .values('count'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def create_counters(apps, schema_editor):
+    """
+    Создает счетчики пользователям, у которых их еще нет: раньше
+    строки UserCounter создавались лениво при первом обращении.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    UserCounter = apps.get_model('posts', 'UserCounter')
+    users = (User.objects
+             .filter(counters__isnull=True)
+             .annotate(posts_count=count(Post, 'author'),
+                       followers_count=count(Follow, 'author'),
+                       following_count=count(Follow, 'user'))
+             .values_list('pk', 'posts_count', 'followers_count',
+                          'following_count'))
+    batch = []
+    for user_id, posts, followers, following in users.iterator():
+        batch.append(UserCounter(
+            user_id=user_id, posts_count=posts, followers_count=followers,
+            following_count=following,
+            popular=followers > settings.TIMELINE_FANOUT_LIMIT))
+        if len(batch) >= BATCH_SIZE:
+            UserCounter.objects.bulk_create(batch)
+            batch = []
+    UserCounter.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_usercounter_popular'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
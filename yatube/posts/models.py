@@ -2,6 +2,8 @@ from django.contrib.auth import get_user_model
 from django.db import models
 from pytils.translit import slugify
 
+from core.storage import HashedFileSystemStorage
+
 
 User = get_user_model()
 
@@ -37,12 +39,40 @@ class Group(models.Model):
         super().save(*args, **kwargs)
 
 
+class PostQuerySet(models.QuerySet):
+    """Выборки постов с нужными для шаблонов join-ами"""
+    # Поля, которые выводит posts/includes/post.html
+    FEED_FIELDS = (
+        'text', 'pub_date', 'updated', 'image', 'comments_count',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__title', 'group__slug',
+    )
+
+    def feed(self):
+        """Посты для лент: автор и группа одним запросом."""
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+    def detail(self):
+        """Пост для отдельной страницы."""
+        return self.select_related('author', 'group')
+
+
+class CommentQuerySet(models.QuerySet):
+    def for_post(self, post):
+        """Комментарии поста вместе с авторами."""
+        return (self.filter(post=post)
+                .select_related('author')
+                .only('text', 'created', 'post', 'author__username'))
+
+
 class Post(models.Model):
     """Модель поста"""
     text = models.TextField(verbose_name='Текст поста',
                             help_text='Введите текст поста')
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата публикации')
+    updated = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения')
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -62,13 +92,29 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=HashedFileSystemStorage(),
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество комментариев'
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.text[:15]}'
@@ -95,7 +141,17 @@ class Comment(models.Model):
         verbose_name='Дата создания',
         auto_now_add=True,
     )
-    
+
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('created',)
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
+
+
 class Follow (models.Model):
     user = models.ForeignKey(
         User,
@@ -108,4 +164,84 @@ class Follow (models.Model):
         on_delete= models.CASCADE,
         related_name='following',
         verbose_name='Блогер',
-    )
\ No newline at end of file
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+
+
+class UserCounter(models.Model):
+    """Денормализованные счетчики пользователя"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='counters',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Количество постов')
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Количество подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Количество подписок')
+    popular = models.BooleanField(
+        default=False,
+        verbose_name='Популярный автор',
+        help_text='Посты не раскладываются по лентам подписчиков',
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self) -> str:
+        return f'{self.user_id}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ('-pub_date',)
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+
+class ImportedPost(models.Model):
+    """Соответствие id поста на старой платформе и в базе (import_data)"""
+    source_id = models.CharField(max_length=64, unique=True,
+                                 verbose_name='id на старой платформе')
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='import_source',
+        verbose_name='Пост',
+    )
+
+    class Meta:
+        verbose_name = 'Импортированный пост'
+        verbose_name_plural = 'Импортированные посты'
+
+    def __str__(self) -> str:
+        return f'{self.source_id} -> {self.post_id}'
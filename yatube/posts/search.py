@@ -0,0 +1,88 @@
+"""
+Полнотекстовый поиск постов по тексту, названию и описанию группы.
+
+На SQLite (3.34+) используется таблица FTS5 posts_search с триграммным
+токенизатором: он ищет любые подстроки от трех символов, поэтому
+находит и разные формы русских слов по общей основе. Таблицу
+поддерживают триггеры из миграции 0011_post_search. На других базах
+и для слов короче трех символов поиск идет через icontains.
+"""
+import sqlite3
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Post
+
+
+TRIGRAM_MIN_LENGTH = 3
+
+
+def fts_available():
+    """FTS5 с триграммным токенизатором есть в SQLite начиная с 3.34."""
+    return (connection.vendor == 'sqlite'
+            and sqlite3.sqlite_version_info >= (3, 34, 0))
+
+
+@contextmanager
+def bulk_indexing():
+    """
+    На время массовой вставки постов снимает триггер индексации
+    и затем индексирует все новые посты одним INSERT ... SELECT,
+    что в несколько раз быстрее построчной работы триггера.
+    """
+    if not fts_available():
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger'"
+                       " AND name = 'posts_search_insert'")
+        row = cursor.fetchone()
+        if row is None:
+            yield
+            return
+        last_id = (Post.objects.order_by('-pk')
+                   .values_list('pk', flat=True).first() or 0)
+        cursor.execute('DROP TRIGGER posts_search_insert')
+        try:
+            yield
+        finally:
+            with transaction.atomic():
+                cursor.execute(
+                    'INSERT INTO posts_search'
+                    ' (rowid, text, group_title, group_description)'
+                    ' SELECT p.id, p.text, g.title, g.description'
+                    ' FROM posts_post p'
+                    ' LEFT JOIN posts_group g ON g.id = p.group_id'
+                    ' WHERE p.id > %s', [last_id])
+                cursor.execute(row[0])
+
+
+def match_expression(terms):
+    """Строка запроса FTS5: все слова обязательны, каждое в кавычках."""
+    return ' '.join('"{}"'.format(term.replace('"', '""'))
+                    for term in terms)
+
+
+def search_posts(query, queryset=None):
+    """Фильтрует посты, содержащие все слова запроса."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    terms = query.split()
+    long_terms = [term for term in terms
+                  if len(term) >= TRIGRAM_MIN_LENGTH]
+    if fts_available() and long_terms:
+        # pk__in=RawSQL(...) SQLite понял бы как список из одного
+        # значения, поэтому подзапрос добавляется в WHERE напрямую
+        queryset = queryset.extra(
+            where=['"posts_post"."id" IN (SELECT rowid FROM posts_search'
+                   ' WHERE posts_search MATCH %s)'],
+            params=[match_expression(long_terms)])
+        terms = [term for term in terms if term not in long_terms]
+    for term in terms:
+        queryset = queryset.filter(
+            Q(text__icontains=term)
+            | Q(group__title__icontains=term)
+            | Q(group__description__icontains=term))
+    return queryset
@@ -0,0 +1,133 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import bump
+from . import counters, follows, timelines
+from .models import Comment, Follow, Group, Post, UserCounter
+
+
+User = get_user_model()
+
+
+def post_scopes(post):
+    """Области кэша страниц, на которых виден пост."""
+    scopes = ['index', f'profile:{post.author.username}', f'post:{post.pk}']
+    if post.group_id:
+        scopes.append(f'group:{post.group.slug}')
+    return scopes
+
+
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_old_names(sender, instance, update_fields=None, **kwargs):
+    # Вход в систему сохраняет только last_login, имена не читаем
+    instance._old_names = None
+    if instance.pk and (update_fields is None
+                        or set(update_fields) & set(USER_NAME_FIELDS)):
+        instance._old_names = (User.objects
+                               .filter(pk=instance.pk)
+                               .values_list(*USER_NAME_FIELDS)
+                               .first())
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserCounter.objects.get_or_create(user=instance)
+    old_names = getattr(instance, '_old_names', None)
+    names = tuple(getattr(instance, field) for field in USER_NAME_FIELDS)
+    if old_names is None or old_names == names:
+        return
+    # Имя автора видно на страницах его постов: лента, группы, профиль
+    groups = (Group.objects
+              .filter(posts__author=instance)
+              .values_list('slug', flat=True)
+              .distinct())
+    bump('index', f'profile:{old_names[0]}', f'profile:{instance.username}',
+         *(f'group:{slug}' for slug in groups))
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, **kwargs):
+    instance._old_group_slug = None
+    if instance.pk:
+        instance._old_group_slug = (Group.objects
+                                    .filter(posts__pk=instance.pk)
+                                    .values_list('slug', flat=True)
+                                    .first())
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, 'posts_count', 1)
+        timelines.fan_out(instance)
+    scopes = post_scopes(instance)
+    if getattr(instance, '_old_group_slug', None):
+        scopes.append(f'group:{instance._old_group_slug}')
+    bump(*scopes)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'posts_count', -1)
+    bump(*post_scopes(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+    bump(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.user_id, 'following_count', 1)
+        counters.bump_user(instance.author_id, 'followers_count', 1)
+        timelines.update_popularity(instance.author)
+    follows.invalidate(instance.user_id)
+    bump(f'profile:{instance.user.username}',
+         f'profile:{instance.author.username}',
+         f'follows:{instance.user_id}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.user_id, 'following_count', -1)
+    counters.bump_user(instance.author_id, 'followers_count', -1)
+    timelines.update_popularity(instance.author)
+    follows.invalidate(instance.user_id)
+    bump(f'profile:{instance.user.username}',
+         f'profile:{instance.author.username}',
+         f'follows:{instance.user_id}')
+
+
+@receiver(pre_save, sender=Group)
+def remember_old_slug(sender, instance, **kwargs):
+    instance._old_slug = None
+    if instance.pk:
+        instance._old_slug = (Group.objects
+                              .filter(pk=instance.pk)
+                              .values_list('slug', flat=True)
+                              .first())
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    scopes = ['index', f'group:{instance.slug}']
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug and old_slug != instance.slug:
+        scopes.append(f'group:{old_slug}')
+    bump(*scopes)
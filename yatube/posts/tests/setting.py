@@ -1,12 +1,21 @@
+import random
 import shutil
 import tempfile
 
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
 from yatube.settings import BASE_DIR
 
+from core.budget import query_budget
+from posts.models import Comment, Follow, Group, Post
+
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=BASE_DIR)
 
+User = get_user_model()
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class BaseTestCase(TestCase):
@@ -15,8 +24,41 @@ class BaseTestCase(TestCase):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
-    
-
 
+class QueryBudgetMixin:
+    """
+    Наполняет базу правдоподобным объемом данных и проверяет,
+    что страница укладывается в бюджет SQL-запросов и времени.
+    """
+    SEED_USERS = 30
+    SEED_GROUPS = 5
+    SEED_POSTS = 150
+    SEED_COMMENTS = 300
+    SEED_FOLLOWS = 60
 
+    @classmethod
+    def seed_data(cls):
+        rnd = random.Random(0)
+        users = mixer.cycle(cls.SEED_USERS).blend(User)
+        groups = mixer.cycle(cls.SEED_GROUPS).blend(Group)
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=rnd.choice(users),
+                 group=rnd.choice(groups + [None]))
+            for number in range(cls.SEED_POSTS))
+        posts = list(Post.objects.all())
+        Comment.objects.bulk_create(
+            Comment(text=f'Комментарий {number}', author=rnd.choice(users),
+                    post=rnd.choice(posts))
+            for number in range(cls.SEED_COMMENTS))
+        pairs = {tuple(rnd.sample(users, 2))
+                 for _ in range(cls.SEED_FOLLOWS)}
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author) for user, author in pairs)
+        return users, groups, posts
 
+    def assertWithinBudget(self, client, path, max_queries,
+                           max_seconds=None, method='get'):
+        cache.clear()
+        with query_budget(max_queries, max_seconds, label=path):
+            response = getattr(client, method)(path)
+        return response
@@ -0,0 +1,85 @@
+from http import HTTPStatus
+from io import StringIO
+
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from about import urls as about_urls
+from posts import urls as posts_urls
+from posts.models import Follow
+from posts.tests.setting import BaseTestCase, QueryBudgetMixin
+from users import urls as users_urls
+
+
+URL_MODULES = (posts_urls, users_urls, about_urls)
+
+# Максимальное число SQL-запросов на холодный (без кэша) запрос страницы
+QUERY_BUDGETS = {
+    'posts:index': 5,
+    'posts:index_rss': 4,
+    'posts:index_atom': 4,
+    'posts:group_rss': 5,
+    'posts:group_atom': 5,
+    'posts:profile_rss': 5,
+    'posts:profile_atom': 5,
+    'posts:group_list': 6,
+    'posts:profile': 7,
+    'posts:profile_export': 3,
+    'posts:post_detail': 6,
+    'posts:post_create': 3,
+    'posts:post_edit': 5,
+    'posts:add_comment': 3,
+    'posts:follow_index': 5,
+    'posts:profile_follow': 6,
+    'posts:profile_unfollow': 11,
+    'posts:api_follow_posts': 4,
+    'users:logout': 4,
+    'users:password_reset_confirm': 3,
+}
+DEFAULT_QUERY_BUDGET = 2
+MAX_SECONDS = 1.0
+
+REDIRECT_CODES = (HTTPStatus.FOUND, HTTPStatus.MOVED_PERMANENTLY)
+
+
+class URLBudgetTest(QueryBudgetMixin, BaseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users, groups, posts = cls.seed_data()
+        cls.user = users[0]
+        cls.post = next(post for post in posts if post.author == cls.user)
+        cls.author = next(post.author for post in posts
+                          if post.author != cls.user)
+        Follow.objects.get_or_create(user=cls.user, author=cls.author)
+        call_command('recount_counters', stdout=StringIO())
+        cls.kwargs = {
+            'slug': groups[0].slug,
+            'username': cls.author.username,
+            'post_id': cls.post.id,
+            'uidb64': urlsafe_base64_encode(force_bytes(cls.user.pk)),
+            'token': default_token_generator.make_token(cls.user),
+        }
+
+    def named_urls(self):
+        for module in URL_MODULES:
+            for pattern in module.urlpatterns:
+                name = f'{module.app_name}:{pattern.name}'
+                kwargs = {key: self.kwargs[key]
+                          for key in pattern.pattern.converters}
+                yield name, reverse(name, kwargs=kwargs)
+
+    def test_every_named_url_is_within_budget(self):
+        for name, path in self.named_urls():
+            with self.subTest(url=name):
+                client = Client()
+                client.force_login(self.user)
+                response = self.assertWithinBudget(
+                    client, path,
+                    QUERY_BUDGETS.get(name, DEFAULT_QUERY_BUDGET),
+                    MAX_SECONDS)
+                self.assertIn(response.status_code,
+                              (HTTPStatus.OK,) + REDIRECT_CODES)
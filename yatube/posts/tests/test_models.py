@@ -1,8 +1,24 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+from mixer.backend.django import mixer
 from pytils.translit import slugify
 
+from django.core.cache import cache
+
+from posts import follows
+from posts.search import search_posts
 from posts.tests.setting import BaseTestCase
-from posts.models import Group, Post
+from posts.counters import get_counters
+from posts.models import (Comment, Follow, Group, ImportedPost, Post,
+                          TimelineEntry, UserCounter)
 
 User = get_user_model()
 
@@ -119,3 +135,246 @@ class PostModelTest(BaseTestCase):
                                      field['help_text'],
                                      (f"help_text поля {field['field']} "
                                       "не соответствует ожидаемому"))
+
+
+class CountersTest(BaseTestCase):
+    def setUp(self):
+        self.author = mixer.blend(User)
+        self.follower = mixer.blend(User)
+        self.post = mixer.blend(Post, author=self.author)
+
+    def test_counters_are_created_from_actual_data(self):
+        counters = get_counters(self.author)
+        self.assertEqual(counters.posts_count, 1)
+        self.assertEqual(counters.followers_count, 0)
+
+    def test_counters_follow_changes(self):
+        get_counters(self.author)
+        get_counters(self.follower)
+        mixer.blend(Post, author=self.author)
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        self.post.delete()
+        counters = UserCounter.objects.get(user=self.author)
+        self.assertEqual(counters.posts_count, 1)
+        self.assertEqual(counters.followers_count, 1)
+        self.assertEqual(get_counters(self.follower).following_count, 1)
+        follow.delete()
+        counters.refresh_from_db()
+        self.assertEqual(counters.followers_count, 0)
+
+    def test_counters_are_created_with_user(self):
+        self.assertTrue(UserCounter.objects.filter(
+            user=mixer.blend(User)).exists())
+
+    def test_bump_creates_missing_counters(self):
+        UserCounter.objects.filter(user=self.author).delete()
+        Follow.objects.create(user=self.follower, author=self.author)
+        counters = UserCounter.objects.get(user=self.author)
+        self.assertEqual(counters.followers_count, 1)
+        self.assertEqual(counters.posts_count, 1)
+
+    def test_comments_count(self):
+        comment = mixer.blend(Comment, post=self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_recount_counters_repairs_values(self):
+        get_counters(self.author)
+        mixer.blend(Comment, post=self.post)
+        UserCounter.objects.update(posts_count=100)
+        Post.objects.update(comments_count=100)
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(get_counters(self.author).posts_count, 1)
+        self.assertEqual(get_counters(self.follower).posts_count, 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+
+class FollowGraphTest(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = mixer.blend(User)
+        self.authors = mixer.cycle(3).blend(User)
+        Follow.objects.create(user=self.user, author=self.authors[0])
+
+    def test_followees_are_cached(self):
+        with self.assertNumQueries(1):
+            follows.followees(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(follows.followees(self.user),
+                             {self.authors[0].pk})
+            self.assertTrue(follows.is_following(self.user, self.authors[0]))
+            self.assertEqual(
+                follows.is_following_many(
+                    self.user, [author.pk for author in self.authors]),
+                {self.authors[0].pk: True, self.authors[1].pk: False,
+                 self.authors[2].pk: False})
+
+    def test_follow_and_unfollow_reset_cache(self):
+        follows.followees(self.user)
+        follow = Follow.objects.create(user=self.user,
+                                       author=self.authors[1])
+        self.assertEqual(follows.followees(self.user),
+                         {self.authors[0].pk, self.authors[1].pk})
+        follow.delete()
+        self.assertEqual(follows.followees(self.user), {self.authors[0].pk})
+
+    def test_anonymous_user_follows_nobody(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(follows.followees(AnonymousUser()), frozenset())
+
+
+class GenerateDataTest(BaseTestCase):
+    OPTIONS = {'users': 40, 'groups': 5, 'posts': 300, 'comments': 200,
+               'follows': 150, 'batch_size': 64}
+
+    def generate(self, **options):
+        call_command('generate_data', stdout=StringIO(),
+                     **{**self.OPTIONS, **options})
+
+    def test_generates_consistent_data(self):
+        self.generate()
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Group.objects.count(), 5)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertFalse(Comment.objects.filter(
+            created__lt=F('post__pub_date')).exists())
+        posts_per_author = sorted(
+            counter.posts_count for counter in UserCounter.objects.all())
+        self.assertEqual(sum(posts_per_author), 300)
+        # Степенной закон: самый плодовитый автор пишет намного больше
+        # медианного
+        self.assertGreater(posts_per_author[-1],
+                           5 * posts_per_author[len(posts_per_author) // 2])
+        post = Post.objects.last()
+        self.assertIn(post, search_posts(max(post.text.split(), key=len)))
+        follow = Follow.objects.first()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=follow.user, post__author=follow.author).exists())
+
+    def test_same_seed_gives_same_data(self):
+        self.generate(prefix='first')
+        self.generate(prefix='second')
+        texts = {
+            prefix: list(Post.objects
+                         .filter(author__username__startswith=prefix)
+                         .order_by('pk')
+                         .values_list('text', flat=True))
+            for prefix in ('first', 'second')
+        }
+        self.assertEqual(texts['first'], texts['second'])
+
+    def test_refuses_to_reuse_prefix(self):
+        self.generate(posts=0, comments=0, follows=0)
+        with self.assertRaises(CommandError):
+            self.generate()
+
+
+class ImportDataTest(BaseTestCase):
+    POSTS = [
+        {'id': 101, 'author': 'old_author', 'text': 'Первый пост',
+         'pub_date': '2015-03-01T10:00:00', 'group': 'Старая группа'},
+        {'id': 102, 'author': 'old_author', 'text': 'Второй пост',
+         'pub_date': '2015-03-02T10:00:00'},
+        {'id': 103, 'author': 'other_author', 'text': 'Третий пост',
+         'pub_date': '2015-03-03T10:00:00', 'group': 'Старая группа'},
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def import_data(self, path, kind, **options):
+        call_command('import_data', path, kind=kind, batch_size=2,
+                     transaction_size=2, stdout=StringIO(), **options)
+
+    def test_import_posts_comments_and_follows(self):
+        posts = self.write('posts.ndjson', '\n'.join(
+            json.dumps(record) for record in self.POSTS))
+        comments = self.write(
+            'comments.csv',
+            'post,author,text,created\n'
+            '101,reader,Комментарий,2015-03-05T10:00:00\n')
+        follows = self.write(
+            'follows.ndjson', '{"user": "reader", "author": "old_author"}')
+        self.import_data(posts, 'posts')
+        self.import_data(comments, 'comments')
+        self.import_data(follows, 'follows')
+
+        post = Post.objects.get(import_source__source_id='101')
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.author.username, 'old_author')
+        self.assertEqual(post.group.slug, slugify('Старая группа'))
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(get_counters(post.author).posts_count, 2)
+        self.assertEqual(get_counters(post.author).followers_count, 1)
+        reader = User.objects.get(username='reader')
+        self.assertEqual(
+            set(reader.timeline.values_list('post__text', flat=True)),
+            {'Первый пост', 'Второй пост'})
+        self.assertFalse(os.path.exists(posts + '.checkpoint'))
+
+    def test_import_resumes_from_checkpoint(self):
+        posts = self.write('posts.ndjson', '\n'.join(
+            json.dumps(record) for record in self.POSTS))
+        self.write('posts.ndjson.checkpoint', '2')
+        self.import_data(posts, 'posts')
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)),
+            ['Третий пост'])
+
+    def test_import_does_not_overwrite_existing_posts(self):
+        existing = mixer.blend(Post, pk=101, image='')
+        posts = self.write('posts.ndjson', '\n'.join(
+            json.dumps(record) for record in self.POSTS))
+        comments = self.write(
+            'comments.csv',
+            'post,author,text,created\n'
+            '101,reader,Комментарий,2015-03-05T10:00:00\n'
+            '999,reader,К неизвестному посту,2015-03-05T10:00:00\n')
+        self.import_data(posts, 'posts')
+        self.import_data(posts, 'posts', restart=True)
+        self.import_data(comments, 'comments')
+
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertFalse(existing.comments.exists())
+        imported = Post.objects.get(import_source__source_id='101')
+        self.assertNotEqual(imported.pk, existing.pk)
+        self.assertEqual(
+            list(imported.comments.values_list('text', flat=True)),
+            ['Комментарий'])
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_import_posts_without_source_id(self):
+        records = [dict(record) for record in self.POSTS]
+        del records[0]['id']
+        posts = self.write('posts.ndjson', '\n'.join(
+            json.dumps(record) for record in records))
+        self.import_data(posts, 'posts')
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(ImportedPost.objects.count(), 2)
+
+    def test_export_can_be_imported_back(self):
+        author = mixer.blend(User)
+        posts = mixer.cycle(3).blend(Post, author=author, image='')
+        path = os.path.join(self.directory, 'export.ndjson')
+        call_command('export_data', author.username, output=path)
+        pub_dates = {str(post.pk): post.pub_date for post in posts}
+        Post.objects.all().delete()
+        self.import_data(path, 'posts')
+        self.assertEqual(
+            dict(Post.objects.values_list('import_source__source_id',
+                                          'pub_date')),
+            pub_dates)
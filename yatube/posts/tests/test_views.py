@@ -1,15 +1,28 @@
+import csv
+import io
+import json
+import zipfile
+from datetime import timedelta
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.paginator import Page
 from django.test import Client
 from django.urls import reverse
 from faker import Faker
 from mixer.backend.django import mixer
 from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
+from core.cache import bump
 from posts.forms import PostForm
-from posts.models import Group, Post, Follow
+from posts import thumbnails
+from posts.fragments import FRAGMENT_TEMPLATE
+from posts.models import (Comment, Group, Post, Follow, TimelineEntry,
+                          UserCounter)
 from posts.tests.setting import BaseTestCase
 from yatube.settings import POSTS_PER_PAGE
 
@@ -100,15 +113,23 @@ class IndexViewTest(FixtureForTest):
         self.assertImageIsInContext(test_post, self.goust_user, self.path)
 
     def test_index_page_caching(self):
-        response_before_post_delete = self.goust_user.get(self.path)
-        self.get_first_post_on_page(response_before_post_delete).delete()
-        response_after_post_delete = self.goust_user.get(self.path)
-        cache.clear()
-        response_after_cache_delete = self.goust_user.get(self.path)
-        self.assertEqual(response_after_post_delete.content,
-                         response_after_post_delete.content)
-        self.assertNotEqual(response_after_post_delete.content,
-                            response_after_cache_delete.content)
+        """
+        Главная страница берется из кэша, пока посты не менялись,
+        и обновляется сразу после удаления поста
+        """
+        response_before = self.goust_user.get(self.path)
+        Post.objects.update(text=self.faker.text())
+        response_cached = self.goust_user.get(self.path)
+        self.assertEqual(response_before.content, response_cached.content)
+        deleted_post = self.get_first_post_on_page(response_before)
+        deleted_post_id = deleted_post.id
+        deleted_post.delete()
+        response_after_delete = self.goust_user.get(self.path)
+        self.assertNotEqual(response_cached.content,
+                            response_after_delete.content)
+        self.assertNotIn(deleted_post_id,
+                         [post.id for post in
+                          response_after_delete.context['page_obj']])
 
     def test_index_template(self):
         response = self.goust_user.get(self.path)
@@ -313,6 +334,13 @@ class ProfileFollowTest(FixtureForTest):
         self.assertEqual(Follow.objects.count(),
                          follow_count + 1)
     
+    def test_repeated_subscribe_creates_one_follow(self):
+        follow_count = Follow.objects.count()
+        self.authorized_user.get(self.path_follow)
+        self.authorized_user.get(self.path_follow)
+        self.assertEqual(Follow.objects.count(),
+                         follow_count + 1)
+
     def test_authorized_user_can_unsubscribe(self):
         self.authorized_user.get(self.path_follow)
         follow_count = Follow.objects.count()
@@ -354,4 +382,664 @@ class FollowIndexTest(FixtureForTest):
         response = self.authorized_user.get(self.path)
         test_post =self.get_first_post_on_page(response)
         self.assertNotEqual(exepted_post, test_post)
-                  
\ No newline at end of file
+                  
+
+class CursorPaginatorTest(FixtureForTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.path = reverse('posts:index')
+        cls.goust_user = Client()
+        mixer.cycle(POSTS_PER_PAGE + 3).blend(Post)
+
+    def test_cursor_pages_do_not_overlap(self):
+        """
+        Курсорная пагинация выдает страницы без пересечений
+        и возвращается назад на первую страницу
+        """
+        first_page = self.goust_user.get(
+            self.path + '?cursor=').context['page_obj']
+        self.assertEqual(len(first_page), POSTS_PER_PAGE)
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+        cache.clear()
+        second_page = self.goust_user.get(
+            self.path + '?cursor=' + first_page.next_cursor
+        ).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertFalse(set(first_page) & set(second_page))
+        cache.clear()
+        previous_page = self.goust_user.get(
+            self.path + '?cursor=' + second_page.previous_cursor
+        ).context['page_obj']
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.goust_user.get(self.path + '?cursor=broken')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class FollowTimelineTest(FixtureForTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.path = reverse('posts:follow_index')
+
+    def setUp(self):
+        super().setUp()
+        self.user = mixer.blend(User)
+        self.authorized_user = Client()
+        self.authorized_user.force_login(self.user)
+        self.author = mixer.blend(User)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.old_post = mixer.blend(Post, author=self.author)
+
+    def follow(self):
+        self.authorized_user.get(
+            reverse('posts:profile_follow', args=(self.author.username,)))
+
+    def get_feed(self):
+        return list(self.authorized_user.get(self.path).context['page_obj'])
+
+    def test_follow_backfills_timeline(self):
+        self.follow()
+        self.assertEqual(self.get_feed(), [self.old_post])
+
+    def test_new_post_fans_out_to_followers(self):
+        self.follow()
+        self.author_client.post(reverse('posts:post_create'),
+                                data={'text': self.faker.text()})
+        new_post = Post.objects.filter(author=self.author).first()
+        self.assertEqual(self.get_feed(), [new_post, self.old_post])
+
+    def test_unfollow_prunes_timeline(self):
+        self.follow()
+        self.authorized_user.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,)))
+        self.assertEqual(self.get_feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_merged_on_read(self):
+        self.follow()
+        self.author_client.post(reverse('posts:post_create'),
+                                data={'text': self.faker.text()})
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(len(self.get_feed()), 2)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_that_stops_being_popular_is_fanned_out(self):
+        self.follow()
+        other = mixer.blend(User)
+        Follow.objects.create(user=other, author=self.author)
+        popular_post = mixer.blend(Post, author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(
+            post=popular_post).exists())
+        Follow.objects.get(user=other).delete()
+        self.assertEqual(self.get_feed(), [popular_post, self.old_post])
+
+    def test_post_created_outside_views_fans_out(self):
+        self.follow()
+        new_post = Post.objects.create(author=self.author,
+                                       text=self.faker.text())
+        self.assertEqual(self.get_feed(), [new_post, self.old_post])
+
+    @override_settings(TIMELINE_BACKFILL=2)
+    def test_follow_backfills_only_latest_posts(self):
+        """Старые посты сверх TIMELINE_BACKFILL в ленту не попадают"""
+        newer_posts = mixer.cycle(2).blend(Post, author=self.author)
+        self.follow()
+        self.assertEqual(self.get_feed(), newer_posts[::-1])
+
+    @override_settings(TIMELINE_DEPTH=3, TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_merges_latest_posts_up_to_depth(self):
+        self.follow()
+        popular = mixer.blend(User)
+        Follow.objects.create(user=self.user, author=popular)
+        Follow.objects.create(user=mixer.blend(User), author=popular)
+        self.assertTrue(UserCounter.objects.get(user=popular).popular)
+        posts = [mixer.blend(Post, author=author)
+                 for author in (self.author, popular, self.author, popular)]
+        self.assertEqual(self.get_feed(), posts[:0:-1])
+
+
+class FeedQueryCountTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.author = mixer.blend(User)
+        self.group = mixer.blend(Group)
+        self.post = mixer.blend(Post, author=self.author, group=self.group,
+                                image='')
+        self.user = mixer.blend(User)
+        self.authorized_user = Client()
+        self.authorized_user.force_login(self.user)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.paths = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.id,)),
+        )
+
+    def count_queries(self, path):
+        self.authorized_user.get(path)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_user.get(path)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """
+        Количество запросов на странице не растет вместе с числом
+        постов, авторов, групп и комментариев
+        """
+        before = {path: self.count_queries(path) for path in self.paths}
+        for _ in range(POSTS_PER_PAGE):
+            mixer.blend(Post, author=self.author, group=self.group, image='')
+            mixer.blend(Post, author=mixer.blend(User),
+                        group=mixer.blend(Group), image='')
+            mixer.blend(Comment, post=self.post, author=mixer.blend(User))
+        for path in self.paths:
+            with self.subTest(path=path):
+                self.assertEqual(self.count_queries(path), before[path])
+
+
+class FeedCacheInvalidationTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.goust_user = Client()
+        self.group = mixer.blend(Group)
+        self.author = mixer.blend(User)
+        mixer.cycle(POSTS_PER_PAGE + 1).blend(
+            Post, author=self.author, group=self.group)
+        self.paths = (
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+
+    def test_new_post_invalidates_every_page_variant(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                self.goust_user.get(path)
+                second_page = self.goust_user.get(path + '?page=2')
+                new_post = mixer.blend(Post, author=self.author,
+                                       group=self.group)
+                response = self.goust_user.get(path)
+                self.assertEqual(response.context['page_obj'][0], new_post)
+                response = self.goust_user.get(path + '?page=2')
+                self.assertNotEqual(response.content, second_page.content)
+
+    def test_author_name_change_invalidates_pages(self):
+        paths = self.paths + (reverse('posts:index'),)
+        for path in paths:
+            self.goust_user.get(path)
+        self.author.first_name = 'Новое'
+        self.author.last_name = 'Имя'
+        self.author.save()
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertContains(self.goust_user.get(path), 'Новое Имя')
+
+    def test_group_slug_change_invalidates_old_page(self):
+        path = self.paths[0]
+        self.goust_user.get(path)
+        self.group.slug = 'new-slug'
+        self.group.save()
+        self.assertEqual(self.goust_user.get(path).status_code,
+                         HTTPStatus.NOT_FOUND)
+
+
+class PostFragmentCacheTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.author = mixer.blend(User)
+        self.post = mixer.blend(Post, author=self.author, image='',
+                                text='Текст поста')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(mixer.blend(User))
+
+    def test_feed_uses_cached_fragments(self):
+        response = self.reader_client.get(reverse('posts:index'))
+        self.assertTemplateUsed(response, FRAGMENT_TEMPLATE)
+        bump('index')
+        response = self.reader_client.get(reverse('posts:index'))
+        self.assertTemplateNotUsed(response, FRAGMENT_TEMPLATE)
+        self.assertContains(response, self.post.text)
+
+    def test_edit_button_is_not_cached(self):
+        path = reverse('posts:post_detail', args=(self.post.id,))
+        edit_path = reverse('posts:post_edit', args=(self.post.id,))
+        self.assertContains(self.author_client.get(path), edit_path)
+        self.assertNotContains(self.reader_client.get(path), edit_path)
+
+    def test_edited_post_is_rendered_again(self):
+        self.reader_client.get(reverse('posts:index'))
+        self.author_client.post(
+            reverse('posts:post_edit', args=(self.post.id,)),
+            {'text': 'Новый текст'})
+        response = self.reader_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новый текст')
+
+    def test_post_updated_by_queryset_is_rendered_again(self):
+        self.reader_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        bump('index')
+        response = self.reader_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новый текст')
+
+
+class ThumbnailTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        self.small_gif = small_gif
+        self.post = Post.objects.create(
+            author=mixer.blend(User), text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', small_gif, 'image/gif'))
+        self.goust_user = Client()
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        response = self.goust_user.get(reverse('posts:index'))
+        self.assertContains(response, 'Изображение обрабатывается')
+        self.assertNotContains(response, '<img class="card-img')
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        response = self.goust_user.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Изображение обрабатывается')
+        self.assertContains(response, '<img class="card-img')
+
+    def test_generate_marks_post_updated(self):
+        updated = self.post.updated
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.updated, updated)
+
+    def test_generate_marks_posts_with_same_image_updated(self):
+        other = Post.objects.create(
+            author=mixer.blend(User), text='Та же картинка',
+            image=SimpleUploadedFile('copy.gif', self.small_gif,
+                                     'image/gif'))
+        self.assertEqual(other.image.name, self.post.image.name)
+        updated = other.updated
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        other.refresh_from_db()
+        self.assertGreater(other.updated, updated)
+
+
+class SearchTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.goust_user = Client()
+        self.group = mixer.blend(Group, title='Кошачий клуб',
+                                 description='Все о кошках')
+        author = mixer.blend(User)
+        self.cat_post = mixer.blend(Post, author=author, image='',
+                                    text='Коты любят спать на солнце')
+        self.group_post = mixer.blend(Post, author=author, image='',
+                                      group=self.group, text='Без слов')
+        self.other_post = mixer.blend(Post, author=author, image='',
+                                      text='Собаки любят гулять')
+
+    def search(self, query):
+        response = self.goust_user.get(reverse('posts:search'),
+                                       {'q': query})
+        return set(response.context['page_obj'])
+
+    def test_search_by_post_text(self):
+        self.assertEqual(self.search('коты'), {self.cat_post})
+        self.assertEqual(self.search('любят'),
+                         {self.cat_post, self.other_post})
+        self.assertEqual(self.search('любят солнце'), {self.cat_post})
+
+    def test_search_by_group(self):
+        self.assertEqual(self.search('кошачий'), {self.group_post})
+        self.assertEqual(self.search('кошках'), {self.group_post})
+
+    def test_index_follows_changes(self):
+        self.other_post.text = 'Собаки и коты'
+        self.other_post.save()
+        self.group.title = 'Клуб любителей'
+        self.group.save()
+        self.assertEqual(self.search('коты'),
+                         {self.cat_post, self.other_post})
+        self.assertEqual(self.search('кошачий'), set())
+        self.other_post.delete()
+        self.assertEqual(self.search('собаки'), set())
+
+    def test_short_words_are_searched_too(self):
+        self.assertEqual(self.search('на'), {self.cat_post})
+
+
+class ProfileExportTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.author = mixer.blend(User)
+        self.posts = mixer.cycle(3).blend(Post, author=self.author, image='')
+        mixer.blend(Comment, post=self.posts[0], author=self.author,
+                    text='Комментарий автора')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.path = reverse('posts:profile_export',
+                            args=(self.author.username,))
+
+    def get_content(self, client, **params):
+        response = client.get(self.path, params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return b''.join(response.streaming_content)
+
+    def test_posts_ndjson(self):
+        lines = self.get_content(self.author_client).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['id'] for record in records],
+                         [post.id for post in self.posts])
+        self.assertEqual(records[0]['text'], self.posts[0].text)
+
+    def test_comments_csv(self):
+        content = self.get_content(self.author_client, kind='comments',
+                                   format='csv').decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['text'], 'Комментарий автора')
+        self.assertEqual(int(rows[0]['post']), self.posts[0].id)
+
+    def test_zip(self):
+        content = self.get_content(self.author_client, format='zip')
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertEqual(archive.namelist(),
+                             ['posts.ndjson', 'comments.ndjson'])
+            self.assertEqual(
+                len(archive.read('posts.ndjson').splitlines()), 3)
+
+    def test_only_owner_and_staff_can_export(self):
+        other_client = Client()
+        other_client.force_login(mixer.blend(User))
+        response = other_client.get(self.path)
+        self.assertRedirects(
+            response, reverse('posts:profile', args=(self.author.username,)))
+        staff_client = Client()
+        staff_client.force_login(mixer.blend(User, is_staff=True))
+        self.assertTrue(self.get_content(staff_client))
+
+
+class FeedsTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.goust_user = Client()
+        self.author = mixer.blend(User)
+        self.group = mixer.blend(Group)
+        self.post = mixer.blend(Post, author=self.author, group=self.group,
+                                image='', text='Пост для ленты')
+        self.paths = (
+            reverse('posts:index_rss'),
+            reverse('posts:index_atom'),
+            reverse('posts:group_rss', args=(self.group.slug,)),
+            reverse('posts:group_atom', args=(self.group.slug,)),
+            reverse('posts:profile_rss', args=(self.author.username,)),
+            reverse('posts:profile_atom', args=(self.author.username,)),
+        )
+
+    def test_feeds_contain_posts(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                response = self.goust_user.get(path)
+                self.assertContains(response, 'Пост для ленты')
+                self.assertTrue(response.has_header('ETag'))
+                self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_unchanged_feed_returns_304(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                response = self.goust_user.get(path)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.goust_user.get(
+                        path, HTTP_IF_NONE_MATCH=response['ETag']
+                    ).status_code, HTTPStatus.NOT_MODIFIED)
+                with self.assertNumQueries(1):
+                    self.assertEqual(self.goust_user.get(
+                        path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                    ).status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_feed_with_newer_post_is_not_304_by_date(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                last_modified = self.goust_user.get(path)['Last-Modified']
+                post = mixer.blend(Post, author=self.author,
+                                   group=self.group, image='',
+                                   text=f'Новый пост {path}')
+                # Last-Modified с точностью до секунды
+                newest = Post.objects.latest('pub_date').pub_date
+                Post.objects.filter(pk=post.pk).update(
+                    pub_date=newest + timedelta(seconds=1))
+                response = self.goust_user.get(
+                    path, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertContains(response, f'Новый пост {path}')
+
+    def test_new_post_changes_feed(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                etag = self.goust_user.get(path)['ETag']
+                mixer.blend(Post, author=self.author, group=self.group,
+                            image='', text=f'Новый пост {path}')
+                response = self.goust_user.get(path,
+                                               HTTP_IF_NONE_MATCH=etag)
+                self.assertContains(response, f'Новый пост {path}')
+
+
+class ConditionalGetTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.goust_user = Client()
+        self.author = mixer.blend(User)
+        self.group = mixer.blend(Group)
+        self.post = mixer.blend(Post, author=self.author, group=self.group,
+                                image='')
+        self.list_paths = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        self.detail_path = reverse('posts:post_detail', args=(self.post.pk,))
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def get_etag(self, client, path):
+        response = client.get(path)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response['ETag']
+
+    def test_unchanged_page_returns_304_without_page_queries(self):
+        for path in self.list_paths:
+            with self.subTest(path=path):
+                etag = self.get_etag(self.goust_user, path)
+                with self.assertNumQueries(0):
+                    response = self.goust_user.get(
+                        path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+        etag = self.get_etag(self.goust_user, self.detail_path)
+        with self.assertNumQueries(1):
+            response = self.goust_user.get(self.detail_path,
+                                           HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_etag_depends_on_user(self):
+        for path in self.list_paths + (self.detail_path,):
+            with self.subTest(path=path):
+                self.assertNotEqual(self.get_etag(self.goust_user, path),
+                                    self.get_etag(self.author_client, path))
+
+    def test_new_post_changes_list_etags(self):
+        etags = {path: self.get_etag(self.goust_user, path)
+                 for path in self.list_paths}
+        mixer.blend(Post, author=self.author, group=self.group, image='')
+        for path in self.list_paths:
+            with self.subTest(path=path):
+                response = self.goust_user.get(
+                    path, HTTP_IF_NONE_MATCH=etags[path])
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_comment_and_follow_change_post_detail_etag(self):
+        changes = (
+            lambda: mixer.blend(Comment, post=self.post,
+                                author=mixer.blend(User)),
+            lambda: Follow.objects.create(user=mixer.blend(User),
+                                          author=self.author),
+        )
+        for change in changes:
+            with self.subTest(change=change):
+                etag = self.get_etag(self.goust_user, self.detail_path)
+                change()
+                response = self.goust_user.get(self.detail_path,
+                                               HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+@override_settings(API_PAGE_SIZE=3)
+class ApiTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.goust_user = Client()
+        self.author = mixer.blend(User)
+        self.group = mixer.blend(Group)
+        self.posts = mixer.cycle(5).blend(Post, author=self.author,
+                                          group=self.group, image='')
+        self.post = self.posts[0]
+        mixer.cycle(4).blend(Comment, post=self.post,
+                             author=mixer.blend(User))
+
+    def get_json(self, path, client=None, **params):
+        response = (client or self.goust_user).get(path, params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.json()
+
+    def collect_pages(self, path, **params):
+        ids = []
+        data = self.get_json(path, **params)
+        ids += [item['id'] for item in data['results']]
+        while data['next']:
+            data = self.get_json(path, cursor=data['next'], **params)
+            ids += [item['id'] for item in data['results']]
+        return ids
+
+    def test_feeds_are_paginated_by_cursor(self):
+        expected = [post.pk for post in
+                    Post.objects.order_by('-pub_date', '-id')]
+        for path in (reverse('posts:api_posts'),
+                     reverse('posts:api_group_posts',
+                             args=(self.group.slug,)),
+                     reverse('posts:api_profile_posts',
+                             args=(self.author.username,))):
+            with self.subTest(path=path):
+                self.assertEqual(self.collect_pages(path), expected)
+
+    def test_comments_are_paginated_by_cursor(self):
+        path = reverse('posts:api_post_comments', args=(self.post.pk,))
+        expected = list(self.post.comments
+                        .order_by('-created', '-id')
+                        .values_list('id', flat=True))
+        self.assertEqual(self.collect_pages(path), expected)
+
+    def test_sparse_fields(self):
+        data = self.get_json(reverse('posts:api_posts'), fields='id,author')
+        self.assertEqual(data['results'][0],
+                         {'id': data['results'][0]['id'],
+                          'author': self.author.username})
+        response = self.goust_user.get(reverse('posts:api_posts'),
+                                       {'fields': 'id,password'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_multi_get_keeps_order_in_one_query(self):
+        ids = [self.posts[3].pk, self.posts[1].pk, 0]
+        with self.assertNumQueries(1):
+            data = self.get_json(reverse('posts:api_posts'),
+                                 ids=','.join(map(str, ids)))
+        self.assertEqual([item['id'] for item in data['results']], ids[:2])
+
+    def test_post_detail(self):
+        data = self.get_json(reverse('posts:api_post_detail',
+                                     args=(self.post.pk,)))
+        self.assertEqual(data['text'], self.post.text)
+        self.assertEqual(data['group'], self.group.slug)
+        self.assertEqual(data['comments_count'], 4)
+        response = self.goust_user.get(reverse('posts:api_post_detail',
+                                               args=(0,)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_follow_feed_requires_login(self):
+        path = reverse('posts:api_follow_posts')
+        response = self.goust_user.get(path)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        client = Client()
+        follower = mixer.blend(User)
+        client.force_login(follower)
+        client.get(reverse('posts:profile_follow',
+                           args=(self.author.username,)))
+        data = self.get_json(path, client=client)
+        self.assertEqual(len(data['results']), 3)
+        self.assertIn('private', client.get(path)['Cache-Control'])
+
+    def test_public_responses_are_cacheable(self):
+        path = reverse('posts:api_post_detail', args=(self.post.pk,))
+        response = self.goust_user.get(path)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self.goust_user.get(
+            path, HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, HTTPStatus.NOT_MODIFIED)
+        mixer.blend(Comment, post=self.post, author=self.author)
+        self.assertEqual(self.goust_user.get(
+            path, HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, HTTPStatus.OK)
+
+    def test_post_detail_changes_with_author_and_group_names(self):
+        path = reverse('posts:api_post_detail', args=(self.post.pk,))
+        renames = (
+            (self.author, 'username', 'renamed_author', 'author'),
+            (self.group, 'slug', 'renamed-group', 'group'),
+        )
+        for instance, field, value, key in renames:
+            with self.subTest(field=key):
+                etag = self.goust_user.get(path)['ETag']
+                setattr(instance, field, value)
+                instance.save()
+                response = self.goust_user.get(path,
+                                               HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(response.json()[key], value)
+
+
+class FollowBadgeTest(FixtureForTest):
+    def setUp(self):
+        super().setUp()
+        self.user = mixer.blend(User)
+        self.client.force_login(self.user)
+        self.author = mixer.blend(User)
+        self.group = mixer.blend(Group)
+        mixer.blend(Post, author=self.author, group=self.group, image='')
+
+    def test_badge_follows_subscription(self):
+        paths = (reverse('posts:index'),
+                 reverse('posts:group_list', args=(self.group.slug,)))
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertNotContains(self.client.get(path), 'вы подписаны')
+        self.client.get(reverse('posts:profile_follow',
+                                args=(self.author.username,)))
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertContains(self.client.get(path), 'вы подписаны')
+        self.client.get(reverse('posts:profile_unfollow',
+                                args=(self.author.username,)))
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertNotContains(self.client.get(path), 'вы подписаны')
@@ -0,0 +1,121 @@
+"""
+Подготовка миниатюр картинок постов в фоновом пуле потоков.
+
+post_create и post_edit ставят картинку в очередь после коммита,
+поэтому первый зритель нового поста не ждет декодирования и ресайза.
+Пока миниатюры не готовы, шаблон выводит заглушку. Готовность
+отмечается в кэше, а одновременные постановки одной и той же картинки
+отсекаются блокировкой через cache.add. Когда миниатюры готовы, у поста
+обновляется updated: это меняет ключ его фрагмента и сбрасывает ленты.
+Картинка с одним содержимым хранится один раз (HashedFileSystemStorage),
+поэтому обновляются все посты с этой картинкой.
+
+THUMBNAIL_WORKERS = 0 отключает пул: миниатюры готовятся сразу после
+коммита в том же потоке (так работают тесты).
+"""
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from sorl.thumbnail import get_thumbnail
+
+from core import metrics
+from .models import Post
+
+
+logger = logging.getLogger(__name__)
+
+# Все размеры, которые используют шаблоны (posts/includes/post_body.html)
+THUMBNAIL_SIZES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails')
+    return _executor
+
+
+def image_key(name, prefix):
+    return f'{prefix}:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def enqueue(post):
+    """
+    Ставит миниатюры картинки поста в очередь после коммита транзакции,
+    если их еще нет и их не готовит другой запрос. Блокировка не
+    снимается и живет THUMBNAIL_LOCK_TIMEOUT секунд, заодно ограничивая
+    частоту повторных попыток после ошибки.
+    """
+    if post.image and not cache.get(
+            image_key(post.image.name, 'thumbnail_ready')):
+        schedule(post.pk, post.image.name)
+
+
+def schedule(post_id, name):
+    if cache.add(image_key(name, 'thumbnail_lock'), 1,
+                 settings.THUMBNAIL_LOCK_TIMEOUT):
+        transaction.on_commit(lambda: submit(post_id, name))
+
+
+def submit(post_id, name):
+    if settings.THUMBNAIL_WORKERS:
+        get_executor().submit(run_in_worker, post_id, name)
+    else:
+        run(post_id, name)
+
+
+def run(post_id, name):
+    try:
+        generate(post_id, name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+
+
+def run_in_worker(post_id, name):
+    try:
+        run(post_id, name)
+    finally:
+        connections.close_all()
+
+
+def generate(post_id, name):
+    """Создает все миниатюры картинки и отмечает их готовность."""
+    post = Post.objects.filter(pk=post_id, image=name).first()
+    if post is None:
+        return
+    started = time.perf_counter()
+    for geometry, options in THUMBNAIL_SIZES:
+        get_thumbnail(post.image, geometry, **options)
+    metrics.THUMBNAIL_SECONDS.observe(time.perf_counter() - started)
+    cache.set(image_key(name, 'thumbnail_ready'), True, None)
+    # save, а не update(): сигнал post_save сбрасывает кэш лент
+    for post in (Post.objects.filter(image=name)
+                 .select_related('author', 'group')):
+        post.save(update_fields=('updated',))
+
+
+def mark_ready(posts):
+    """
+    Выставляет post.thumbnail_ready одним get_many. Картинки без
+    готовых миниатюр (например, если отметка вытеснена из кэша) снова
+    ставятся в очередь.
+    """
+    posts = [post for post in posts if post.image]
+    ready = cache.get_many([image_key(post.image.name, 'thumbnail_ready')
+                            for post in posts])
+    for post in posts:
+        post.thumbnail_ready = (
+            image_key(post.image.name, 'thumbnail_ready') in ready)
+        if not post.thumbnail_ready:
+            schedule(post.pk, post.image.name)
@@ -0,0 +1,181 @@
+"""
+Материализованные ленты подписок (fan-out on write).
+
+Новый пост раскладывается в ленты подписчиков автора при публикации,
+поэтому follow_index читает готовую ленту пользователя, а не собирает
+ее через author__in по всем подпискам.
+Посты популярных авторов (больше TIMELINE_FANOUT_LIMIT подписчиков)
+не раскладываются, а подмешиваются в ленту при чтении. Признак
+популярности хранится в UserCounter.popular и меняется только в
+update_popularity: когда автор перестает быть популярным, ленты всех
+его подписчиков дозаполняются, иначе посты, написанные им в период
+популярности, пропали бы из лент.
+
+При подписке и дозаполнении в ленту попадают только последние
+TIMELINE_BACKFILL постов автора: более старые посты подписки
+в follow_index не видны, их можно найти в профиле автора.
+
+При чтении берутся последние TIMELINE_DEPTH записей ленты и столько же
+последних постов каждого популярного автора, каждое своим запросом по
+индексу (user, -pub_date) или (author, -pub_date), и сливаются в Python:
+в одном запросе с OR база не может использовать индексы для сортировки
+и сортирует все посты ленты и популярных авторов.
+"""
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from .counters import get_counters
+from .models import Follow, Post, TimelineEntry, UserCounter
+
+
+BATCH_SIZE = 1000
+
+
+def is_popular(author):
+    """Вернет True, если посты автора не раскладываются по лентам."""
+    return get_counters(author).popular
+
+
+def update_popularity(author):
+    """
+    Сверяет признак популярности автора с числом подписчиков.
+    Автор, переставший быть популярным, раскладывается по лентам
+    всех своих подписчиков.
+    """
+    counters = get_counters(author)
+    popular = counters.followers_count > settings.TIMELINE_FANOUT_LIMIT
+    if counters.popular == popular:
+        return
+    # Признак меняет только тот, кто первым увидел старое значение
+    flipped = UserCounter.objects.filter(
+        pk=counters.pk, popular=counters.popular
+    ).update(popular=popular)
+    if flipped and not popular:
+        backfill_many(Follow.objects.filter(author=author))
+
+
+def popular_followees(user):
+    """Возвращает id популярных авторов, на которых подписан user."""
+    return (Follow.objects
+            .filter(user=user, author__counters__popular=True)
+            .values_list('author', flat=True))
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_popular(post.author):
+        return
+    followers = (Follow.objects
+                 .filter(author=post.author_id)
+                 .values_list('user', flat=True)
+                 .iterator())
+    entries = (TimelineEntry(user_id=user_id, post=post,
+                             pub_date=post.pub_date)
+               for user_id in followers)
+    _bulk_create(entries)
+
+
+def fan_out_many(posts):
+    """
+    Раскладывает пачку постов по лентам: подписчики всех авторов
+    пачки читаются одним запросом. Используется при импорте.
+    """
+    authors = {post.author_id for post in posts}
+    popular = set(UserCounter.objects
+                  .filter(user__in=authors, popular=True)
+                  .values_list('user', flat=True))
+    followers = defaultdict(list)
+    for user_id, author_id in (Follow.objects
+                               .filter(author__in=authors - popular)
+                               .values_list('user', 'author')
+                               .iterator()):
+        followers[author_id].append(user_id)
+    entries = (TimelineEntry(user_id=user_id, post_id=post.pk,
+                             pub_date=post.pub_date)
+               for post in posts
+               for user_id in followers[post.author_id])
+    _bulk_create(entries)
+
+
+def backfill(user, author):
+    """Добавляет в ленту user последние посты author после подписки."""
+    if is_popular(author):
+        return
+    posts = (Post.objects
+             .filter(author=author)
+             .order_by('-pub_date')
+             .values_list('id', 'pub_date')
+             [:settings.TIMELINE_BACKFILL])
+    entries = (TimelineEntry(user=user, post_id=post_id, pub_date=pub_date)
+               for post_id, pub_date in posts)
+    _bulk_create(entries)
+
+
+def backfill_many(follows):
+    """
+    То же, что backfill, для всех подписок из QuerySet follows
+    одним INSERT ... SELECT. Подписки на популярных авторов
+    пропускаются.
+    """
+    table = connection.ops.quote_name
+    follows_sql, follows_params = (follows.order_by()
+                                   .values('user', 'author')
+                                   .query.sql_with_params())
+    sql = (
+        f'{connection.ops.insert_statement(ignore_conflicts=True)}'
+        f' {table(TimelineEntry._meta.db_table)}'
+        f' (user_id, post_id, pub_date)'
+        f' SELECT f.user_id, p.id, p.pub_date FROM ({follows_sql}) f'
+        f' JOIN (SELECT id, author_id, pub_date, ROW_NUMBER() OVER'
+        f' (PARTITION BY author_id ORDER BY pub_date DESC) AS position'
+        f' FROM {table(Post._meta.db_table)}'
+        f' WHERE author_id IN (SELECT author_id FROM ({follows_sql}) a)) p'
+        f' ON p.author_id = f.author_id'
+        f' JOIN {table(UserCounter._meta.db_table)} c'
+        f' ON c.user_id = f.author_id'
+        f' WHERE p.position <= %s AND c.popular = %s'
+        f' {connection.ops.ignore_conflicts_suffix_sql(True)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*follows_params, *follows_params,
+                             settings.TIMELINE_BACKFILL, False])
+        return cursor.rowcount
+
+
+def prune(user, author):
+    """Удаляет посты author из ленты user после отписки."""
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def timeline(user):
+    """
+    Возвращает посты ленты подписок user, не больше TIMELINE_DEPTH:
+    материализованную ленту плюс посты популярных авторов.
+    """
+    depth = settings.TIMELINE_DEPTH
+    sources = [TimelineEntry.objects
+               .filter(user=user)
+               .order_by('-pub_date', '-post_id')
+               .values_list('pub_date', 'post')[:depth]]
+    for author_id in popular_followees(user):
+        sources.append(Post.objects
+                       .filter(author=author_id)
+                       .order_by('-pub_date', '-id')
+                       .values_list('pub_date', 'id')[:depth])
+    newest = heapq.merge(*(list(rows) for rows in sources), reverse=True)
+    ids = [post_id for _, post_id in list(newest)[:depth]]
+    return Post.objects.filter(id__in=ids)
+
+
+def _bulk_create(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
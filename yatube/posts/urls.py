@@ -1,13 +1,24 @@
 from django.urls import path
 
-from . import views
+from . import api, feeds, views
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('rss/', feeds.index_rss, name='index_rss'),
+    path('atom/', feeds.index_atom, name='index_atom'),
     path('group/<slug>/', views.group_posts, name='group_list'),
+    path('group/<slug>/rss/', feeds.group_rss, name='group_rss'),
+    path('group/<slug>/atom/', feeds.group_atom, name='group_atom'),
+    path('search/', views.search, name='search'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/rss/', feeds.profile_rss,
+         name='profile_rss'),
+    path('profile/<str:username>/atom/', feeds.profile_atom,
+         name='profile_atom'),
+    path('profile/<str:username>/export/', views.profile_export,
+         name='profile_export'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
@@ -15,4 +26,12 @@ urlpatterns = [
     path('follow/', views.follow_index, name='follow_index'),    
     path('profile/<str:username>/follow/',views.profile_follow, name='profile_follow'),
     path('profile/<str:username>/unfollow/',views.profile_unfollow,name='profile_unfollow'),
+    path('api/posts/', api.posts, name='api_posts'),
+    path('api/posts/<int:post_id>/', api.post_detail, name='api_post_detail'),
+    path('api/posts/<int:post_id>/comments/', api.post_comments,
+         name='api_post_comments'),
+    path('api/group/<slug>/posts/', api.group_posts, name='api_group_posts'),
+    path('api/profile/<str:username>/posts/', api.profile_posts,
+         name='api_profile_posts'),
+    path('api/follow/posts/', api.follow_posts, name='api_follow_posts'),
 ]
@@ -1,22 +1,39 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from core.utils import paginator, check_subscribed, check_subscription_button
+from django.db import transaction
+from core import metrics
+from core.cache import cache_feed, scoped_etag, user_key, versions_etag
+from core.utils import paginator, check_subscription_button
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
+from django.views.decorators.http import condition
 
 
+from . import export, follows, thumbnails, timelines
+from .counters import get_counters
+from .fragments import attach_fragments, with_fragments
 from .forms import PostForm, CommentsForm
 from .models import Group, Post, Comment, Follow
+from .search import search_posts
 
 
 User = get_user_model()
 
 
-@cache_page(20, key_prefix='index_page')
+def with_following(user, page_obj):
+    """Отмечает посты страницы, на авторов которых подписан user."""
+    page_obj.object_list = follows.mark_following(user, page_obj.object_list)
+    return page_obj
+
+
+@condition(etag_func=scoped_etag('index', 'follows:{user}'))
+@cache_feed('index', 'follows:{user}')
 def index(request):
     """ Возвращает главную страницу с десятью последними постами """
-    post_list = Post.objects.select_related('author').all()
-    page_obj = paginator(post_list, request)
+    post_list = Post.objects.feed()
+    page_obj = with_following(request.user,
+                              with_fragments(paginator(post_list, request)))
     template = 'posts/index.html'
     context = {
         'page_obj': page_obj,
@@ -25,12 +42,14 @@ def index(request):
     return render(request, template, context)
 
 
-
+@condition(etag_func=scoped_etag('group:{slug}', 'follows:{user}'))
+@cache_feed('group:{slug}', 'follows:{user}')
 def group_posts(request, slug):
     """ Возращает страницу с постами группы """
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = paginator(post_list, request)
+    post_list = group.posts.feed()
+    page_obj = with_following(request.user,
+                              with_fragments(paginator(post_list, request)))
     template = 'posts/group_list.html'
     context = {
         'group': group,
@@ -39,28 +58,90 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@condition(etag_func=scoped_etag('profile:{username}'))
+@cache_feed('profile:{username}')
 def profile(request, username):
     """ Возвращает страничку пользователя с десятью последними постами """
     author = get_object_or_404(User, username=username)
-    posts_author = author.posts.all()
-    page_obj = paginator(posts_author, request)
+    posts_author = author.posts.feed()
+    page_obj = with_fragments(paginator(posts_author, request))
     template = 'posts/profile.html'
     context = {
         'author': author,
+        'counters': get_counters(author),
         'page_obj': page_obj,
-        'following': check_subscribed(request.user, author),
+        'following': follows.is_following(request.user, author),
         'subscription_button': check_subscription_button(request.user,
                                                          author)
     }
     return render(request, template, context)
 
 
+def search(request):
+    """ Возвращает посты, в которых встречаются все слова запроса """
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        post_list = search_posts(query).feed()
+        page_obj = with_following(
+            request.user, with_fragments(paginator(post_list, request)))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@login_required
+def profile_export(request, username):
+    """ Отдает потоком все посты или комментарии пользователя.
+        Выгрузка доступна самому пользователю и персоналу сайта,
+        остальные перенаправляются на страницу профиля.
+    """
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        return redirect('posts:profile', username)
+    kind = request.GET.get('kind', 'posts')
+    file_format = request.GET.get('format', 'ndjson')
+    if file_format == 'zip':
+        content = export.zip_stream(author)
+        filename = f'{username}.zip'
+    elif kind in export.RECORDS and file_format in export.FORMATS:
+        content = export.export_bytes(author, kind, file_format)
+        filename = f'{username}-{kind}.{file_format}'
+    else:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+    response = StreamingHttpResponse(
+        content, content_type=export.CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def post_detail_etag(request, post_id):
+    """ ETag страницы поста: версии поста (правки, комментарии) и
+        профиля автора (его счетчики) плюс пользователь
+    """
+    username = (Post.objects
+                .filter(pk=post_id)
+                .values_list('author__username', flat=True)
+                .first())
+    if username is None:
+        return None
+    return versions_etag(request,
+                         [f'post:{post_id}', f'profile:{username}'],
+                         user_key(request))
+
+
+@condition(etag_func=post_detail_etag)
 def post_detail(request, post_id):
     """ Возвращает страницу поста """
-    post = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.filter(post=post)
+    post = get_object_or_404(Post.objects.detail(), pk=post_id)
+    attach_fragments([post])
+    comments = Comment.objects.for_post(post)
     comment_form = CommentsForm()
     context = {'post': post,
+               'author_counters': get_counters(post.author),
                'comments': comments,
                'comment_form': comment_form,
                }
@@ -76,7 +157,11 @@ def post_create(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post.save()
+            thumbnails.enqueue(post)
+        if post.image:
+            metrics.UPLOAD_BYTES.observe(post.image.size)
         username = request.user.username
         return redirect('posts:profile', username)
     return render(request, template, {'form': form})
@@ -98,6 +183,9 @@ def post_edit(request, post_id):
                     instance=post)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data and post.image:
+            thumbnails.enqueue(post)
+            metrics.UPLOAD_BYTES.observe(post.image.size)
         return redirect(page_detail, post_id)
     context = {
         'form': form,
@@ -115,18 +203,18 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
     # информация о текущем пользователе доступна в переменной request.user
-    follow_exists = Follow.objects.filter(user=request.user).exists()
-    authors = Follow.objects.filter(user=request.user).values_list('author', flat=True)
-    post_list = Post.objects.filter(author__in=authors)
+    follow_exists = bool(follows.followees(request.user))
+    post_list = timelines.timeline(request.user).feed()
     context = {
-        'page_obj': paginator(post_list, request),
+        'page_obj': with_fragments(paginator(post_list, request)),
         'follow': True,
         'follow_exists':follow_exists
         }
@@ -136,15 +224,20 @@ def follow_index(request):
 @login_required
 def profile_follow(request, username):
     author = User.objects.get(username=username)
-    follow = Follow(user=request.user,
-                    author=author)
-    follow.save()
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(user=request.user,
+                                                  author=author)
+        if created:
+            timelines.backfill(request.user, author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = User.objects.get(username=username)
-    follow = Follow.objects.get(user=request.user, author=author)
-    follow.delete()
+    follow = Follow.objects.select_related('user', 'author').get(
+        user=request.user, author=author)
+    with transaction.atomic():
+        follow.delete()
+        timelines.prune(request.user, author)
     return redirect('posts:profile', username=username)
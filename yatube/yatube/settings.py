@@ -51,11 +51,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -68,7 +72,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.timing.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -96,11 +100,88 @@ DATABASES = {
     }
 }
 
+# Общий для всех воркеров на хосте кэш в отображенном в память файле
+# (см. core.mmap_cache): инвалидация через версии ключей доходит
+# до всех процессов сразу
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.mmap_cache.MmapCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default.cache'),
+        'OPTIONS': {
+            'SLOTS': 4096,
+            'SLOT_SIZE': 64 * 1024,
+        },
     }
-} 
+}
+
+# Ленты кэшируются надолго: при изменении постов, групп и подписок
+# версии их ключей сбрасываются сигналами (см. core.cache)
+FEED_CACHE_TIMEOUT = 60 * 60
+# Сколько секунд после истечения срока отдавать устаревшую копию,
+# пока один запрос пересчитывает страницу
+FEED_CACHE_GRACE = 60
+# Сколько секунд живет блокировка пересчета страницы
+FEED_CACHE_LOCK_TIMEOUT = 10
+# Сколько секунд запрос ждет чужой пересчет страницы, которой еще
+# нет в кэше, прежде чем посчитать ее сам без сохранения
+FEED_CACHE_WAIT = 0.2
+# Фрагменты разметки постов: ключ меняется при редактировании поста,
+# поэтому срок нужен только чтобы не держать в кэше удаленные посты
+POST_FRAGMENT_TIMEOUT = 60 * 60 * 24
+# Потоки, в которых заранее готовятся миниатюры картинок постов
+# (0 - без пула, в потоке запроса после коммита), и время, в течение
+# которого картинка не ставится в очередь повторно
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_LOCK_TIMEOUT = 60
+# Множества подписок пользователей сбрасываются сигналами Follow,
+# срок только вытесняет из кэша неактивных пользователей
+FOLLOWEES_TIMEOUT = 60 * 60 * 24
+
+# Доля запросов, для которых замеряются SQL, шаблоны и кэш
+# (заголовок Server-Timing и строка в логе core.timing). Для отладки
+# задается переменной окружения, например SERVER_TIMING_SAMPLE_RATE=1
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.environ.get('SERVER_TIMING_SAMPLE_RATE', 0.01))
+
+# Запросы к базе дольше SLOW_QUERY_THRESHOLD секунд записываются
+# с планом в SLOW_QUERY_LOG (см. команду slow_query_report);
+# None отключает журнал
+SLOW_QUERY_THRESHOLD = 0.1
+SLOW_QUERY_LOG = os.path.join(BASE_DIR, 'logs', 'slow_queries.log')
+
+# Профили запросов с ?profile от сотрудников: каталог файлов
+# и интервал между выборками стека, секунд
+PROFILES_ROOT = os.path.join(BASE_DIR, 'profiles')
+PROFILER_INTERVAL = 0.005
+
+# Файлы метрик воркеров для /metrics/ (см. core.metrics); каталог
+# очищается при перезапуске сервиса. None хранит метрики в памяти
+# процесса. Без входа /metrics/ отдается только с METRICS_ALLOWED_IPS.
+# За обратным прокси на том же хосте у всех запросов REMOTE_ADDR
+# 127.0.0.1, поэтому адреса сборщика добавляются сюда, только если
+# прокси сам закрывает /metrics/ снаружи
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+METRICS_ALLOWED_IPS = ()
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core.slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
 
 
 # Password validation
@@ -137,6 +218,16 @@ USE_TZ = True
 
 POSTS_PER_PAGE = 10
 
+# 'pages' - нумерованные страницы (?page=),
+# 'cursor' - курсорная пагинация без COUNT и OFFSET (?cursor=)
+PAGINATION_MODE = 'pages'
+
+# JSON API: размер страницы ленты, предел ?ids= и сколько секунд
+# клиенты и прокси могут не перепроверять ответ
+API_PAGE_SIZE = 20
+API_MAX_IDS = 100
+API_CACHE_MAX_AGE = 30
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
@@ -153,4 +244,13 @@ LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
-
+# Авторы с большим числом подписчиков не раскладываются по лентам
+# подписок при публикации, их посты подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько последних постов автора попадает в ленту после подписки;
+# более старые посты в follow_index не показываются
+TIMELINE_BACKFILL = 200
+# Сколько последних постов ленты подписок видно в follow_index;
+# id постов уходят в запрос списком, поэтому число держится меньше
+# 999 - лимита параметров запроса в старых SQLite
+TIMELINE_DEPTH = 500
@@ -0,0 +1,28 @@
+"""
+Настройки для тестов: manage.py test и pytest подключают их вместо
+yatube.settings (см. manage.py и pytest.ini).
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import LOGGING
+
+# Тесты не должны видеть кэш, оставшийся в файле от прошлых запусков
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Миниатюры готовятся сразу: потоки пула писали бы в базу тестов
+# после конца теста
+THUMBNAIL_WORKERS = 0
+# Метрики в памяти процесса, без файлов
+METRICS_DIR = None
+
+LOGGING = {
+    **LOGGING,
+    'loggers': {
+        'core.timing': {**LOGGING['loggers']['core.timing'],
+                        'level': 'WARNING'},
+        'core.slow_queries': {**LOGGING['loggers']['core.slow_queries'],
+                              'level': 'ERROR'},
+    },
+}